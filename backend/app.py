@@ -1,116 +1,103 @@
 # backend/app.py
+import json
+import logging
 import os
-import sys
 from datetime import datetime
-from flask import Flask, jsonify, request
+import orjson
+from flask import Flask, jsonify, make_response, request
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager
 from dotenv import load_dotenv
 
-# Enable better error logging
-sys.stdout.flush()
-sys.stderr.flush()
+load_dotenv()
 
-print("🚀 Starting Learnium Backend...")
-print(f"🔧 Python version: {sys.version}")
 
-load_dotenv()
-print("✅ Environment variables loaded")
+class OrjsonProvider(JSONProvider):
+    """JSON provider backed by orjson - jsonify() and request.get_json() go through this."""
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=str).decode("utf-8")
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
-from models import init_db
-from routes.auth import auth_bp
-from routes.courses import courses_bp
-from routes.plans import plans_bp
-from routes.materials import materials_bp
-from routes.chat import chat_bp
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # Production configuration
 IS_PRODUCTION = os.getenv("FLASK_ENV") == "production" or os.getenv("ENVIRONMENT") == "production"
 
-print(f"🔧 Environment: {'PRODUCTION' if IS_PRODUCTION else 'DEVELOPMENT'}")
-print(f"🔧 FLASK_ENV: {os.getenv('FLASK_ENV')}")
-print(f"🔧 ENVIRONMENT: {os.getenv('ENVIRONMENT')}")
+logging.basicConfig(level=logging.WARNING if IS_PRODUCTION else logging.INFO)
+logger = logging.getLogger(__name__)
+logger.info("Starting Learnium Backend (%s)", "PRODUCTION" if IS_PRODUCTION else "DEVELOPMENT")
+
+# Flag rejected preflights - these show up as CORS errors in the browser.
+# after_request hooks run in reverse registration order, so registering this
+# before CORS(app) makes it see the headers Flask-CORS adds
+@app.after_request
+def log_rejected_preflight(response):
+    if request.method == "OPTIONS" and "Access-Control-Allow-Origin" not in response.headers:
+        logger.warning("CORS preflight rejected for origin: %s", request.headers.get("Origin"))
+    return response
 
 # CORS Configuration - restrict to production domain in production
 if IS_PRODUCTION:
     frontend_url = os.getenv("FRONTEND_URL", "").strip()
-    print(f"🔧 FRONTEND_URL: {frontend_url if frontend_url else 'NOT SET'}")
     
     if not frontend_url:
-        print("⚠️  WARNING: FRONTEND_URL not set in production. Using permissive CORS.")
-        print("⚠️  This allows ALL origins. Set FRONTEND_URL for security!")
+        logger.warning("FRONTEND_URL not set in production. Using permissive CORS that allows ALL origins.")
         # Don't crash - use permissive CORS but log warning
         CORS(app, 
              supports_credentials=True,
              allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
              methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-             max_age=3600)
+             max_age=86400)  # Cache preflight for 24 hours
     else:
         # Normalize URL - ensure HTTPS for production
         if frontend_url.startswith("http://") and IS_PRODUCTION:
-            print(f"⚠️  WARNING: FRONTEND_URL uses HTTP, converting to HTTPS for production")
+            logger.warning("FRONTEND_URL uses HTTP, converting to HTTPS for production")
             frontend_url = frontend_url.replace("http://", "https://", 1)
         
-        # Support both with and without trailing slash, and both http/https variants
-        allowed_origins = [
-            frontend_url.rstrip('/'),
-            frontend_url,
-            frontend_url.replace("https://", "http://", 1),  # Allow HTTP too for flexibility
-            frontend_url.replace("http://", "https://", 1).rstrip('/')
-        ]
+        # Browsers send Origin as scheme://host with no trailing slash, so one
+        # canonical form per host is enough
+        canonical_origin = frontend_url.rstrip('/')
+        allowed_origins = [canonical_origin]
         
-        # Also add www and non-www variants
-        if "www." in frontend_url:
-            # If URL has www, also allow without www
-            non_www = frontend_url.replace("www.", "", 1)
-            allowed_origins.extend([non_www, non_www.rstrip('/')])
-        else:
-            # If URL doesn't have www, also allow with www
-            # Only add www if it's a domain (not localhost)
-            if not frontend_url.startswith("http://localhost") and not frontend_url.startswith("https://localhost"):
-                www_url = frontend_url.replace("://", "://www.", 1)
-                allowed_origins.extend([www_url, www_url.rstrip('/')])
-                # Also add https variant if it was http
-                if www_url.startswith("http://"):
-                    www_https = www_url.replace("http://", "https://", 1)
-                    allowed_origins.extend([www_https, www_https.rstrip('/')])
+        # Also allow the www / non-www variant of a real domain (not localhost)
+        if "://www." in canonical_origin:
+            allowed_origins.append(canonical_origin.replace("://www.", "://", 1))
+        elif "://localhost" not in canonical_origin:
+            allowed_origins.append(canonical_origin.replace("://", "://www.", 1))
         
-        # Remove duplicates while preserving order
-        allowed_origins = list(dict.fromkeys([o for o in allowed_origins if o]))
-        print(f"✅ CORS configured for: {allowed_origins}")
-        print(f"🔍 Will allow requests from these origins: {', '.join(allowed_origins)}")
+        logger.info("CORS configured for: %s", ", ".join(allowed_origins))
         
         CORS(app, 
              origins=allowed_origins,
              supports_credentials=True,
              allow_headers=["Content-Type", "Authorization", "X-Requested-With"],
              methods=["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-             max_age=3600)  # Cache preflight for 1 hour
+             max_age=86400)  # Cache preflight for 24 hours
 else:
     # Development: allow all origins
-    print("✅ CORS configured for development (all origins)")
-    CORS(app, supports_credentials=True)
+    # Shorter preflight cache in development so CORS changes show up quickly
+    CORS(app, supports_credentials=True, max_age=600)
 
 # JWT Configuration
 jwt_secret = os.getenv("JWT_SECRET_KEY")
 if IS_PRODUCTION:
     if not jwt_secret or jwt_secret == "dev-secret-key-change-in-production":
-        print("⚠️  WARNING: JWT_SECRET_KEY not set or using default. Generating temporary secret.")
+        logger.warning("JWT_SECRET_KEY not set or using default. Using a temporary secret - set JWT_SECRET_KEY!")
         # Generate a temporary secret instead of crashing
         import secrets
         jwt_secret = secrets.token_urlsafe(32)
-        print("⚠️  WARNING: Using temporary JWT secret. Set JWT_SECRET_KEY in environment variables!")
     elif len(jwt_secret) < 32:
-        print("⚠️  WARNING: JWT_SECRET_KEY is too short. Generating temporary secret.")
+        logger.warning("JWT_SECRET_KEY is too short. Using a temporary secret.")
         import secrets
         jwt_secret = secrets.token_urlsafe(32)
-    else:
-        print("✅ JWT_SECRET_KEY configured")
 else:
     jwt_secret = jwt_secret or "dev-secret-key-change-in-production"
-    print("✅ JWT using development secret")
 
 app.config["JWT_SECRET_KEY"] = jwt_secret
 app.config["JWT_ACCESS_TOKEN_EXPIRES"] = False  # We handle expiration in routes
@@ -124,86 +111,113 @@ app.config["UPLOAD_FOLDER"] = os.path.join(os.path.dirname(__file__), "uploads")
 app.config["MAX_CONTENT_LENGTH"] = 16 * 1024 * 1024  # 16MB max file size
 os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
 
-# Security headers for production
+# Answer CORS preflights before routing/auth - Flask-CORS's after_request hook adds
+# the Access-Control-* headers to this empty response
+@app.before_request
+def short_circuit_preflight():
+    if request.method == "OPTIONS" and "Access-Control-Request-Method" in request.headers:
+        return app.response_class(status=204)
+
+# Security headers for production (built once - IS_PRODUCTION doesn't change after boot)
+_SECURITY_HEADERS = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+} if IS_PRODUCTION else {}
+
 @app.after_request
 def set_security_headers(response):
-    if IS_PRODUCTION:
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+    if _SECURITY_HEADERS:
+        response.headers.update(_SECURITY_HEADERS)
     
-    # Debug: Log CORS headers (helpful for debugging)
-    origin = request.headers.get('Origin', 'unknown')
-    if request.method == "OPTIONS":
-        print(f"🔍 OPTIONS preflight from origin: {origin}")
-        if 'Access-Control-Allow-Origin' in response.headers:
-            print(f"✅ CORS Allow-Origin header: {response.headers['Access-Control-Allow-Origin']}")
-        else:
-            print(f"❌ WARNING: CORS Allow-Origin header NOT found in response for origin: {origin}")
-            print(f"   This will cause CORS errors! Check CORS configuration.")
-    elif origin != 'unknown' and IS_PRODUCTION:
-        # Log actual requests too for debugging
-        print(f"📡 {request.method} {request.path} from origin: {origin}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("%s %s from origin: %s", request.method, request.path, request.headers.get("Origin"))
     
     return response
 
 # Init MongoDB - DO NOT initialize before fork (fork-safe)
 # Skip init_db() here - it will be called after workers fork in gunicorn
 # This prevents the PyMongo "opened before fork" warning
-print("✅ MongoDB initialization deferred until after worker fork (fork-safe)")
 
-# Register blueprints
-try:
+def _register_blueprints(app):
+    """Import and register route blueprints.
+
+    Route modules pull in bcrypt, pypdf, openai and tiktoken, so they are
+    imported here rather than at the top of the module.
+    """
+    from routes.auth import auth_bp
+    from routes.courses import courses_bp
+    from routes.plans import plans_bp
+    from routes.materials import materials_bp
+    from routes.chat import chat_bp
+
     app.register_blueprint(auth_bp, url_prefix="/api/auth")
     app.register_blueprint(courses_bp, url_prefix="/api/courses")
     app.register_blueprint(plans_bp, url_prefix="/api/plans")
     app.register_blueprint(materials_bp, url_prefix="/api/materials")
     app.register_blueprint(chat_bp, url_prefix="/api/chat")
-    
-    # Debug: Print registered auth routes
-    print("✅ All routes registered successfully")
-    print(f"   Auth routes: POST /api/auth/register, POST /api/auth/login, GET /api/auth/me")
-except Exception as e:
-    print(f"❌ Error registering routes: {e}")
-    import traceback
-    traceback.print_exc()
+
+
+# Register blueprints
+try:
+    _register_blueprints(app)
+except Exception:
+    logger.exception("Error registering routes")
     raise
 
 
+@app.route("/api/health/live")
 @app.route("/api/health")
 @app.route("/health")
 @app.route("/")
 def health():
-    """Health check endpoint for monitoring and Railway health checks."""
-    # Fast, simple health check that Railway can verify quickly
-    # Return minimal response to avoid any timeout issues
-    return jsonify({
-        "status": "ok"
-    }), 200
+    """Liveness check for monitoring and Railway health checks - no database call."""
+    response = make_response(jsonify({"status": "ok"}), 200)
+    response.headers["Cache-Control"] = "public, max-age=5"
+    return response
+
+
+@app.route("/api/health/ready")
+def health_ready():
+    """Readiness check - verifies MongoDB is reachable."""
+    from models import get_db
+    try:
+        get_db().command("ping")
+        response = make_response(jsonify({"status": "ok", "database": "ok"}), 200)
+    except Exception as e:
+        logger.error("Readiness check failed: %s", e)
+        response = make_response(jsonify({"status": "error", "database": "unreachable"}), 503)
+    response.headers["Cache-Control"] = "no-store"
+    return response
 
 # Error handlers
+# Bodies are encoded once at startup. A fresh Response is still built per call because
+# after_request hooks (CORS, security headers) mutate the response's headers.
+_NOT_FOUND_BODY = json.dumps({"error": "Resource not found"})
+_INTERNAL_ERROR_BODY = json.dumps({"error": "An internal error occurred"})
+_FILE_TOO_LARGE_BODY = json.dumps({"error": "File too large. Maximum size is 16MB"})
+
 @app.errorhandler(404)
 def not_found(error):
-    return jsonify({"error": "Resource not found"}), 404
+    return app.response_class(_NOT_FOUND_BODY, status=404, mimetype="application/json")
 
 @app.errorhandler(500)
 def internal_error(error):
     if IS_PRODUCTION:
-        return jsonify({"error": "An internal error occurred"}), 500
+        return app.response_class(_INTERNAL_ERROR_BODY, status=500, mimetype="application/json")
     else:
         return jsonify({"error": str(error)}), 500
 
 @app.errorhandler(413)
 def file_too_large(error):
-    return jsonify({"error": "File too large. Maximum size is 16MB"}), 413
+    return app.response_class(_FILE_TOO_LARGE_BODY, status=413, mimetype="application/json")
 
 
 if __name__ == "__main__":
     # Can be used in production as fallback if gunicorn fails
     port = int(os.getenv("PORT", 5001))
     debug_mode = os.getenv("FLASK_ENV") != "production" and os.getenv("ENVIRONMENT") != "production"
-    print(f"🚀 Starting Flask server on port {port}")
-    print(f"✅ Application ready! Environment: {'PRODUCTION' if IS_PRODUCTION else 'DEVELOPMENT'}")
+    logger.info("Starting Flask server on port %s", port)
     app.run(debug=debug_mode, port=port, host="0.0.0.0")
\ No newline at end of file
@@ -1,6 +1,30 @@
 # gunicorn_config.py
-# Post-fork hook to initialize MongoDB after worker fork (fork-safe)
+# Patch the stdlib for gevent before anything else is imported. With --preload the
+# app (and pymongo) are imported in the master, so this has to happen here rather
+# than relying on the worker patching itself after fork.
+from gevent import monkey
+monkey.patch_all()
+
+import os
+
+# Async workers - routes spend most of their time waiting on MongoDB and OpenAI
+worker_class = "gevent"
+worker_connections = 1000
+# Each gevent worker already serves many requests concurrently, and holds its own
+# MongoDB pool and PDF process pool - cpu_count() reports host cores on Railway
+workers = int(os.getenv("WEB_CONCURRENCY", 2))
+keepalive = 5
+
+# Import the app once in the master so workers share its pages copy-on-write.
+# MongoDB is only connected in post_fork, so nothing fork-unsafe is opened here.
+preload_app = True
 
+# Recycle workers periodically to release memory accumulated from PDF parsing
+max_requests = 1000
+max_requests_jitter = 100
+
+
+# Post-fork hook to initialize MongoDB after worker fork (fork-safe)
 def post_fork(server, worker):
     """Called after a worker has been forked."""
     # Initialize database indexes after fork (fork-safe)
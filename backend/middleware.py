@@ -1,7 +1,5 @@
 from functools import wraps
-from flask import request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from models import User
 
 
 def get_current_user_id():
@@ -10,18 +8,17 @@ def get_current_user_id():
 
 
 def require_auth(f):
-    """Decorator to require authentication for a route."""
+    """Decorator to require authentication for a route.
+
+    The JWT signature already proves the identity, so the user document isn't
+    loaded here - routes that need user fields (e.g. /api/auth/me) look it up
+    themselves with User.find_by_id.
+    """
     @wraps(f)
     @jwt_required()
     def decorated_function(*args, **kwargs):
-        user_id = get_current_user_id()
-        user = User.find_by_id(user_id)
-        
-        if not user:
-            return jsonify({"error": "User not found"}), 404
-        
         # Add user_id to kwargs for route functions
-        kwargs['user_id'] = user_id
+        kwargs['user_id'] = get_current_user_id()
         return f(*args, **kwargs)
     
     return decorated_function
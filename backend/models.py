@@ -1,41 +1,76 @@
-from pymongo import MongoClient
-from datetime import datetime, date
+from flask import g, has_request_context
+from pymongo import MongoClient, ReturnDocument
+from pymongo.collection import Collection
+from pymongo.database import Database
+from pymongo.write_concern import WriteConcern
+from pymongo.errors import OperationFailure, PyMongoError
+from datetime import datetime, date, timezone
 from bson import ObjectId
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterator, List
+import orjson
 import os
-from functools import wraps
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache, wraps
 
 # MongoDB connection
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 DB_NAME = os.getenv("MONGO_DB_NAME", "study_coach")
+# Per worker process - every gunicorn worker opens its own pool against the
+# cluster's connection limit, so keep these low and idle connections unheld
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 20))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
 
-# Don't initialize client at module level - causes fork-safety issues with Gunicorn
-# Initialize lazily on first use
-_client = None
-_db = None
+# Don't initialize client at module level - causes fork-safety issues with Gunicorn.
+# Clients are created lazily and keyed by PID, so a worker never reuses a client
+# (and its sockets) inherited from the process it was forked from.
+_clients: Dict[int, MongoClient] = {}
+_dbs: Dict[int, Database] = {}
+_client_lock = threading.Lock()
+_PRIMARY_ONLY_WRITE_CONCERN = WriteConcern(w=1)
 
 def get_client():
-    """Get MongoDB client, initializing if needed (fork-safe)."""
-    global _client
-    if _client is None:
-        try:
-            print(f"🔗 Connecting to MongoDB: {DB_NAME}")
-            _client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-            # Test connection
-            _client.admin.command('ping')
-            print("✅ MongoDB connection successful")
-        except Exception as e:
-            print(f"❌ MongoDB connection error: {e}")
-            print(f"   URI: {MONGO_URI[:50]}..." if len(MONGO_URI) > 50 else f"   URI: {MONGO_URI}")
-            raise
-    return _client
+    """Get the MongoDB client for the current process, initializing if needed (fork-safe)."""
+    pid = os.getpid()
+    client = _clients.get(pid)
+    if client is None:
+        with _client_lock:
+            client = _clients.get(pid)
+            if client is None:
+                # No startup ping - with connect=False the client connects on the
+                # first real query, which surfaces any connection error
+                try:
+                    print(f"🔗 Connecting to MongoDB: {DB_NAME} (pid {pid})")
+                    client = MongoClient(
+                        MONGO_URI,
+                        connect=False,
+                        serverSelectionTimeoutMS=5000,
+                        maxPoolSize=MONGO_MAX_POOL_SIZE,
+                        minPoolSize=MONGO_MIN_POOL_SIZE,
+                        waitQueueTimeoutMS=2000,
+                        # Material docs carry large raw_text blobs - compress them on the wire
+                        compressors="zstd,snappy,zlib",
+                        zlibCompressionLevel=6,
+                        appname="learnium-backend",
+                        retryWrites=True,
+                        retryReads=True,
+                        readPreference="primaryPreferred",
+                    )
+                except Exception as e:
+                    print(f"❌ MongoDB connection error: {e}")
+                    print(f"   URI: {MONGO_URI[:50]}..." if len(MONGO_URI) > 50 else f"   URI: {MONGO_URI}")
+                    raise
+                _clients[pid] = client
+    return client
 
 def get_db():
-    """Get MongoDB database, initializing client if needed."""
-    global _db
-    if _db is None:
-        _db = get_client()[DB_NAME]
-    return _db
+    """Get MongoDB database for the current process, initializing client if needed."""
+    pid = os.getpid()
+    database = _dbs.get(pid)
+    if database is None:
+        database = _dbs[pid] = get_client()[DB_NAME]
+    return database
 
 # For backward compatibility, create lazy properties
 class LazyDB:
@@ -45,10 +80,17 @@ class LazyDB:
 db = LazyDB()
 client = None  # Will be set on first use
 
-# Collections - use lazy initialization
+# Collections - use lazy initialization. Collection objects are cached per
+# (pid, name): Database[name] builds a new Collection on every call.
+_collections: Dict[tuple, Collection] = {}
+
 def get_collection(name):
     """Get a collection by name (fork-safe)."""
-    return get_db()[name]
+    key = (os.getpid(), name)
+    collection = _collections.get(key)
+    if collection is None:
+        collection = _collections[key] = get_db()[name]
+    return collection
 
 def get_users_collection():
     return get_collection("users")
@@ -64,41 +106,16 @@ def get_study_tasks_collection():
 
 # For backward compatibility, create lazy accessors
 class LazyCollection:
+    """Module-level stand-in that resolves to the current process's cached Collection."""
+    
+    __slots__ = ("name",)
+    
     def __init__(self, name):
         self.name = name
     
-    def _get_collection(self):
-        """Get the actual collection (lazy-loaded after fork)."""
-        return get_collection(self.name)
-    
     def __getattr__(self, attr):
-        """Proxy all other attributes to the actual collection."""
-        return getattr(self._get_collection(), attr)
-    
-    # Explicitly define common methods for clarity
-    def find(self, *args, **kwargs):
-        return self._get_collection().find(*args, **kwargs)
-    
-    def find_one(self, *args, **kwargs):
-        return self._get_collection().find_one(*args, **kwargs)
-    
-    def insert_one(self, *args, **kwargs):
-        return self._get_collection().insert_one(*args, **kwargs)
-    
-    def update_one(self, *args, **kwargs):
-        return self._get_collection().update_one(*args, **kwargs)
-    
-    def delete_one(self, *args, **kwargs):
-        return self._get_collection().delete_one(*args, **kwargs)
-    
-    def delete_many(self, *args, **kwargs):
-        return self._get_collection().delete_many(*args, **kwargs)
-    
-    def create_index(self, *args, **kwargs):
-        return self._get_collection().create_index(*args, **kwargs)
-    
-    def update_many(self, *args, **kwargs):
-        return self._get_collection().update_many(*args, **kwargs)
+        """Proxy all other attributes to the actual collection (lazy-loaded after fork)."""
+        return getattr(get_collection(self.name), attr)
 
 users_collection = LazyCollection("users")
 courses_collection = LazyCollection("courses")
@@ -108,30 +125,180 @@ study_tasks_collection = LazyCollection("study_tasks")
 
 def init_db():
     """Initialize database indexes (fork-safe - called after fork)."""
+    database = get_db()
+    create_indexes(database)
+    drop_legacy_indexes(database)
+
+
+def create_indexes(database: Database):
+    """Create the indexes the app's queries rely on (safe to re-run)."""
     # Create indexes for better query performance
     try:
-        get_users_collection().create_index("email", unique=True)
-        get_courses_collection().create_index("user_id")
-        get_courses_collection().create_index([("user_id", 1), ("name", 1)])
-        get_materials_collection().create_index("course_id")
-        get_study_tasks_collection().create_index("course_id")
-        get_study_tasks_collection().create_index([("course_id", 1), ("date", 1)])
+        database.users.create_index("email", unique=True)
+        # Compound indexes match the list queries' sort, so no separate single-field index is needed
+        database.courses.create_index([("user_id", 1), ("created_at", -1)])
+        database.materials.create_index([("course_id", 1), ("created_at", -1)])
+        database.study_tasks.create_index([("course_id", 1), ("date", 1)])
+        # Equality-Sort-Range order for "tasks in a course, by completion, by date"
+        database.study_tasks.create_index(
+            [("course_id", 1), ("completed", 1), ("date", 1)],
+            name="course_completed_date"
+        )
+        # Material deletion clears task references by material_id
+        database.study_tasks.create_index("material_id")
         print("✅ Database indexes created successfully")
     except Exception as e:
         print(f"⚠️  Warning: Could not create indexes: {e}")
         # Don't fail startup if indexes can't be created
+    
+    # Separate try - this fails on databases that already hold duplicate titles
+    # and shouldn't stop the other indexes from being created
+    try:
+        database.materials.create_index(
+            [("course_id", 1), ("title", 1)],
+            unique=True,
+            name="course_title_unique"
+        )
+    except Exception as e:
+        print(f"⚠️  Warning: Could not create unique material title index: {e}")
+
+
+# Single-field indexes superseded by the compound indexes in create_indexes
+_LEGACY_INDEXES = [
+    ("courses", "user_id_1"),
+    ("courses", "user_id_1_name_1"),  # no query looks courses up by name
+    ("materials", "course_id_1"),
+    ("study_tasks", "course_id_1"),
+]
+
+
+def drop_legacy_indexes(database: Database) -> List[str]:
+    """Drop superseded indexes and return the "collection.index" names dropped."""
+    return [
+        f"{collection_name}.{name}"
+        for collection_name, name in _LEGACY_INDEXES
+        if _drop_index_if_exists(database[collection_name], name)
+    ]
+
+
+def _drop_index_if_exists(collection, name: str) -> bool:
+    """Drop an index by name, ignoring it if it doesn't exist. Returns True if dropped."""
+    try:
+        collection.drop_index(name)
+    except OperationFailure:
+        return False
+    except Exception as e:
+        print(f"⚠️  Warning: Could not drop index {name}: {e}")
+        return False
+    return True
+
+
+class TTLCache:
+    """Small thread-safe LRU cache whose entries expire after ttl seconds."""
+    
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[Any, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+    
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+    
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def pop(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+
+@lru_cache(maxsize=8192)
+def to_object_id(value: str) -> ObjectId:
+    """Parse an id string into an ObjectId, caching the result.
+
+    ObjectIds are immutable, so repeat lookups of the same user/course id skip
+    the hex validation and decode.
+    """
+    return ObjectId(value)
+
+
+def _acknowledged_by_primary(collection):
+    """Return the collection with a w=1 write concern.
+
+    Used for cascade cleanup (deleting a course's tasks/materials, unlinking tasks
+    from a deleted material). These writes are idempotent and safe to repeat, so
+    waiting for a replica-set majority isn't worth the extra latency - at worst a
+    primary failover leaves orphans that the next delete or plan regeneration removes.
+    """
+    return collection.with_options(write_concern=_PRIMARY_ONLY_WRITE_CONCERN)
+
+
+def utc_now() -> datetime:
+    """Current time as a timezone-aware UTC datetime."""
+    return datetime.now(timezone.utc)
+
+
+def to_bson_date(value: date) -> datetime:
+    """Convert a calendar date to midnight UTC so it is stored as a native BSON Date."""
+    return datetime(value.year, value.month, value.day, tzinfo=timezone.utc)
+
+
+def to_iso_date(value) -> Optional[str]:
+    """Render a stored calendar date as "YYYY-MM-DD".
+
+    Accepts BSON Dates (read back as datetime) and the ISO strings older
+    documents were written with.
+    """
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    return value
+
+
+def _course_from_doc(course: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the string id and render course dates as ISO strings."""
+    return {
+        **course,
+        "id": str(course["_id"]),
+        "term_start": to_iso_date(course.get("term_start")),
+        "term_end": to_iso_date(course.get("term_end")),
+        "main_exam_date": to_iso_date(course.get("main_exam_date")),
+    }
+
+
+def _task_from_doc(task: Dict[str, Any]) -> Dict[str, Any]:
+    """Add the string id and render the task date as an ISO string."""
+    return {**task, "id": str(task["_id"]), "date": to_iso_date(task.get("date"))}
+
+
+# Public user fields (id, email, name) by user_id - password_hash is never cached
+_user_cache = TTLCache(maxsize=10_000, ttl=60)
 
 
 class User:
     @staticmethod
-    def create(email: str, password_hash: str, name: str = None) -> Dict[str, Any]:
+    def create(email: str, password_hash: bytes, name: str = None) -> Dict[str, Any]:
         """Create a new user."""
+        now = utc_now()
         user = {
             "email": email,
             "password_hash": password_hash,
             "name": name or "",
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
+            "created_at": now,
+            "updated_at": now,
         }
         result = users_collection.insert_one(user)
         user["_id"] = result.inserted_id
@@ -148,153 +315,439 @@ class User:
     
     @staticmethod
     def find_by_id(user_id: str) -> Optional[Dict[str, Any]]:
-        """Find user by ID."""
+        """Find user by ID (email and name only), cached for a short TTL."""
+        cached = _user_cache.get(user_id)
+        if cached is not None:
+            return dict(cached)
+        
+        if not ObjectId.is_valid(user_id):
+            return None
         try:
-            user = users_collection.find_one({"_id": ObjectId(user_id)})
-            if user:
-                user["id"] = str(user["_id"])
-            return user
-        except:
+            user = users_collection.find_one({"_id": to_object_id(user_id)}, {"email": 1, "name": 1})
+        except PyMongoError:
             return None
+        if user:
+            user["id"] = str(user["_id"])
+            _user_cache.set(user_id, user)
+            return dict(user)
+        return None
+    
+    @staticmethod
+    def update_password_hash(user_id: str, password_hash: bytes):
+        """Replace a user's stored bcrypt hash."""
+        users_collection.update_one(
+            {"_id": to_object_id(user_id)},
+            {"$set": {"password_hash": password_hash, "updated_at": utc_now()}}
+        )
+        User.invalidate(user_id)
+    
+    @staticmethod
+    def invalidate(user_id: str):
+        """Drop a user from the in-process cache after it is updated or deleted."""
+        _user_cache.pop(user_id)
+    
+    @staticmethod
+    def exists(user_id: str) -> bool:
+        """Check a user exists without fetching the document."""
+        if not ObjectId.is_valid(user_id):
+            return False
+        try:
+            return users_collection.count_documents({"_id": to_object_id(user_id)}, limit=1) > 0
+        except PyMongoError:
+            return False
+
+
+# Fields the list endpoints actually render
+COURSE_LIST_PROJECTION = {"name": 1, "term_start": 1, "term_end": 1, "main_exam_date": 1, "created_at": 1}
+MATERIAL_LIST_PROJECTION = {"title": 1, "file_path": 1, "created_at": 1}
+STUDY_TASK_LIST_PROJECTION = {"date": 1, "title": 1, "description": 1, "completed": 1}
+
+
+def _request_course_cache() -> Optional[Dict[str, Dict[str, Any]]]:
+    """Course documents by course_id, memoized for the current request only.
+
+    Not shared across requests: a course deleted by another worker must stop
+    authorizing uploads and plan writes at once. Returns None outside a request.
+    """
+    if not has_request_context():
+        return None
+    return g.setdefault("courses_by_id", {})
 
 
 class Course:
     @staticmethod
     def create(user_id: str, name: str, term_start: date, term_end: date, main_exam_date: date = None) -> Dict[str, Any]:
         """Create a new course."""
+        now = utc_now()
         course = {
-            "user_id": ObjectId(user_id),
+            "user_id": to_object_id(user_id),
             "name": name,
-            "term_start": term_start.isoformat(),
-            "term_end": term_end.isoformat(),
-            "main_exam_date": main_exam_date.isoformat() if main_exam_date else None,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
+            "term_start": to_bson_date(term_start),
+            "term_end": to_bson_date(term_end),
+            "main_exam_date": to_bson_date(main_exam_date) if main_exam_date else None,
+            "created_at": now,
+            "updated_at": now,
         }
         result = courses_collection.insert_one(course)
         course["_id"] = result.inserted_id
-        course["id"] = str(result.inserted_id)
-        return course
+        return _course_from_doc(course)
     
     @staticmethod
     def find_by_user(user_id: str) -> list:
         """Find all courses for a user."""
-        courses = list(courses_collection.find({"user_id": ObjectId(user_id)}).sort("created_at", -1))
-        for course in courses:
-            course["id"] = str(course["_id"])
-        return courses
+        cursor = courses_collection.find(
+            {"user_id": to_object_id(user_id)},
+            COURSE_LIST_PROJECTION
+        ).sort("created_at", -1)
+        return [_course_from_doc(course) for course in cursor]
+    
+    @staticmethod
+    def ids_by_user(user_id: str) -> list:
+        """ObjectIds of a user's courses, for filtering other collections by owner."""
+        cursor = courses_collection.find({"user_id": to_object_id(user_id)}, {"_id": 1})
+        return [course["_id"] for course in cursor]
     
     @staticmethod
     def find_by_id(course_id: str, user_id: str = None) -> Optional[Dict[str, Any]]:
-        """Find course by ID, optionally verify ownership."""
-        try:
-            query = {"_id": ObjectId(course_id)}
-            if user_id:
-                query["user_id"] = ObjectId(user_id)
-            
-            course = courses_collection.find_one(query)
-            if course:
-                course["id"] = str(course["_id"])
-            return course
-        except:
+        """Find course by ID, optionally verify ownership. Memoized for the request."""
+        if not ObjectId.is_valid(course_id) or (user_id and not ObjectId.is_valid(user_id)):
             return None
+        cache = _request_course_cache()
+        course = cache.get(course_id) if cache is not None else None
+        if course is None:
+            try:
+                course = courses_collection.find_one({"_id": to_object_id(course_id)})
+            except PyMongoError:
+                return None
+            if not course:
+                return None
+            if cache is not None:
+                cache[course_id] = course
+        
+        if user_id and course["user_id"] != to_object_id(user_id):
+            return None
+        return _course_from_doc(course)
+    
+    @staticmethod
+    def is_owned_by(course_id: str, user_id: str) -> bool:
+        """Check that a course exists and belongs to the user without loading it."""
+        if not ObjectId.is_valid(course_id) or not ObjectId.is_valid(user_id):
+            return False
+        cache = _request_course_cache()
+        cached = cache.get(course_id) if cache is not None else None
+        if cached is not None:
+            return cached["user_id"] == to_object_id(user_id)
+        try:
+            course = courses_collection.find_one(
+                {"_id": to_object_id(course_id), "user_id": to_object_id(user_id)},
+                {"_id": 1}
+            )
+        except PyMongoError:
+            return False
+        return course is not None
     
     @staticmethod
     def delete(course_id: str, user_id: str) -> bool:
         """Delete a course and return True if successful."""
+        if not ObjectId.is_valid(course_id) or not ObjectId.is_valid(user_id):
+            return False
         try:
             result = courses_collection.delete_one({
-                "_id": ObjectId(course_id),
-                "user_id": ObjectId(user_id)
+                "_id": to_object_id(course_id),
+                "user_id": to_object_id(user_id)
             })
-            return result.deleted_count > 0
-        except:
+        except PyMongoError:
             return False
+        if result.deleted_count > 0:
+            cache = _request_course_cache()
+            if cache is not None:
+                cache.pop(course_id, None)
+            return True
+        return False
+
+
+# Large text fields that list/lookup queries don't need to pull over the wire
+MATERIAL_SUMMARY_PROJECTION = {"raw_text": 0, "metadata_json": 0, "sections": 0}
+
+
+# Sections parsed out of legacy metadata_json blobs, keyed by (material id, blob
+# length). Materials are never edited in place, so entries only go stale on
+# delete, and a deleted material is never looked up again
+_legacy_sections_cache = TTLCache(maxsize=256, ttl=3600)
 
 
 class Material:
     @staticmethod
-    def create(course_id: str, title: str, file_path: str = None, raw_text: str = None, metadata_json: str = None) -> Dict[str, Any]:
+    def create(course_id: str, title: str, file_path: str = None, raw_text: str = None, metadata_json: str = None, sections: list = None) -> Dict[str, Any]:
         """Create a new material."""
+        now = utc_now()
         material = {
-            "course_id": ObjectId(course_id),
+            "course_id": to_object_id(course_id),
             "title": title,
             "file_path": file_path,
             "raw_text": raw_text,
             "metadata_json": metadata_json,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
+            "sections": sections,
+            "created_at": now,
+            "updated_at": now,
         }
         result = materials_collection.insert_one(material)
         material["_id"] = result.inserted_id
         material["id"] = str(result.inserted_id)
         return material
     
+    @staticmethod
+    def sections_of(material: Dict[str, Any]) -> list:
+        """Return a material's PDF sections.
+
+        Sections are stored as a native array; older documents only have them
+        inside the metadata_json string.
+        """
+        sections = material.get("sections")
+        if sections is None and material.get("metadata_json"):
+            blob = material["metadata_json"]
+            key = (str(material.get("_id", material.get("id"))), len(blob))
+            sections = _legacy_sections_cache.get(key)
+            if sections is None:
+                sections = orjson.loads(blob).get("sections") or []
+                _legacy_sections_cache.set(key, sections)
+        return sections or []
+    
     @staticmethod
     def find_by_course(course_id: str) -> list:
-        """Find all materials for a course."""
-        materials = list(materials_collection.find({"course_id": ObjectId(course_id)}).sort("created_at", -1))
-        for material in materials:
+        """Find all materials for a course (title and file path only)."""
+        cursor = materials_collection.find(
+            {"course_id": to_object_id(course_id)},
+            MATERIAL_LIST_PROJECTION
+        ).sort("created_at", -1)
+        return [{**material, "id": str(material["_id"])} for material in cursor]
+    
+    @staticmethod
+    def ids_by_course(course_id: str) -> tuple:
+        """Ids of a course's materials, newest first.
+
+        Materials are never edited in place, so this identifies the course's
+        current content. Only _id is fetched.
+        """
+        cursor = materials_collection.find(
+            {"course_id": to_object_id(course_id)},
+            {"_id": 1}
+        ).sort("created_at", -1)
+        return tuple(str(material["_id"]) for material in cursor)
+    
+    @staticmethod
+    def iter_by_course(course_id: str, batch_size: int = 10) -> Iterator[Dict[str, Any]]:
+        """Stream all materials for a course, including extracted text and PDF metadata.
+
+        Documents are fetched batch_size at a time so large raw_text blobs aren't
+        all held in memory at once.
+        """
+        cursor = materials_collection.find(
+            {"course_id": to_object_id(course_id)},
+            comment="materials.iter_by_course"
+        ).sort("created_at", -1).batch_size(batch_size)
+        for material in cursor:
             material["id"] = str(material["_id"])
-        return materials
+            yield material
     
     @staticmethod
     def find_by_id(material_id: str) -> Optional[Dict[str, Any]]:
-        """Find material by ID."""
+        """Find material by ID (without raw_text/metadata_json)."""
+        if not ObjectId.is_valid(material_id):
+            return None
         try:
-            material = materials_collection.find_one({"_id": ObjectId(material_id)})
-            if material:
-                material["id"] = str(material["_id"])
-            return material
-        except:
+            material = materials_collection.find_one({"_id": to_object_id(material_id)}, MATERIAL_SUMMARY_PROJECTION)
+        except PyMongoError:
             return None
+        if material:
+            material["id"] = str(material["_id"])
+        return material
     
     @staticmethod
-    def delete(material_id: str) -> bool:
-        """Delete a material and return True if successful."""
+    def find_with_owner(material_id: str) -> Optional[Dict[str, Any]]:
+        """Find material by ID together with its course's owner in one aggregate.
+
+        The returned dict has "owner_id" (the course's user_id as a string, or
+        None if the course no longer exists) so ownership can be checked without
+        a second lookup.
+        """
+        if not ObjectId.is_valid(material_id):
+            return None
         try:
-            result = materials_collection.delete_one({"_id": ObjectId(material_id)})
-            return result.deleted_count > 0
-        except:
+            results = list(materials_collection.aggregate([
+                {"$match": {"_id": to_object_id(material_id)}},
+                {"$project": {"title": 1, "file_path": 1, "course_id": 1}},
+                {"$lookup": {
+                    "from": "courses",
+                    "localField": "course_id",
+                    "foreignField": "_id",
+                    "as": "course",
+                }},
+            ]))
+        except PyMongoError:
+            return None
+        if not results:
+            return None
+        
+        material = results[0]
+        course = material.pop("course")
+        material["id"] = str(material["_id"])
+        material["owner_id"] = str(course[0]["user_id"]) if course else None
+        return material
+    
+    @staticmethod
+    def delete_with_tasks(material_id: str) -> bool:
+        """Unlink a material from its study tasks and delete it."""
+        if not ObjectId.is_valid(material_id):
             return False
+        try:
+            StudyTask.delete_by_material(material_id)
+            result = _acknowledged_by_primary(materials_collection).delete_one({"_id": to_object_id(material_id)})
+        except PyMongoError:
+            return False
+        return result.deleted_count > 0
+    
+    @staticmethod
+    def delete_by_course(course_id: str) -> int:
+        """Delete all materials for a course in one round trip and return the count."""
+        result = _acknowledged_by_primary(materials_collection).delete_many({"course_id": to_object_id(course_id)})
+        return result.deleted_count
 
 
 class StudyTask:
     @staticmethod
     def create(course_id: str, date: date, title: str, description: str = None, completed: bool = False, material_id: str = None) -> Dict[str, Any]:
         """Create a new study task."""
+        now = utc_now()
         task = {
-            "course_id": ObjectId(course_id),
-            "date": date.isoformat(),
+            "course_id": to_object_id(course_id),
+            "date": to_bson_date(date),
             "title": title,
             "description": description,
             "completed": completed,
-            "material_id": ObjectId(material_id) if material_id else None,
-            "created_at": datetime.utcnow(),
-            "updated_at": datetime.utcnow(),
+            "material_id": to_object_id(material_id) if material_id else None,
+            "created_at": now,
+            "updated_at": now,
         }
         result = study_tasks_collection.insert_one(task)
         task["_id"] = result.inserted_id
-        task["id"] = str(result.inserted_id)
-        return task
+        return _task_from_doc(task)
+    
+    @staticmethod
+    def create_many(course_id: str, tasks: List[Dict[str, Any]]) -> list:
+        """Create several study tasks for a course in a single insert_many round trip.
+
+        Each task dict takes the same fields as create(): date, title and optionally
+        description, completed and material_id.
+        """
+        course_oid = to_object_id(course_id)
+        now = utc_now()
+        docs = [
+            {
+                "course_id": course_oid,
+                "date": to_bson_date(t["date"]),
+                "title": t["title"],
+                "description": t.get("description"),
+                "completed": t.get("completed", False),
+                "material_id": to_object_id(t["material_id"]) if t.get("material_id") else None,
+                "created_at": now,
+                "updated_at": now,
+            }
+            for t in tasks
+        ]
+        if not docs:
+            return []
+        
+        result = study_tasks_collection.insert_many(docs, ordered=False)
+        for doc, inserted_id in zip(docs, result.inserted_ids):
+            doc["_id"] = inserted_id
+        return [_task_from_doc(doc) for doc in docs]
     
     @staticmethod
     def find_by_course(course_id: str) -> list:
         """Find all study tasks for a course."""
-        tasks = list(study_tasks_collection.find({"course_id": ObjectId(course_id)}).sort("date", 1))
-        for task in tasks:
-            task["id"] = str(task["_id"])
-        return tasks
+        cursor = study_tasks_collection.find(
+            {"course_id": to_object_id(course_id)},
+            STUDY_TASK_LIST_PROJECTION
+        ).sort("date", 1)
+        return [_task_from_doc(task) for task in cursor]
+    
+    @staticmethod
+    def find_by_courses(course_ids: List[str], per_course_limit: int = 10, total_limit: int = 50) -> list:
+        """Find study tasks for several courses with one $in query.
+
+        Returns up to per_course_limit tasks per course (earliest first), grouped in
+        the order of course_ids and capped at total_limit overall.
+        """
+        if not course_ids:
+            return []
+        
+        cursor = study_tasks_collection.find(
+            {"course_id": {"$in": [to_object_id(cid) for cid in course_ids]}},
+            {"title": 1, "date": 1, "completed": 1, "course_id": 1}
+        ).sort("date", 1)
+        
+        tasks_by_course = {cid: [] for cid in course_ids}
+        for task in cursor:
+            bucket = tasks_by_course[str(task["course_id"])]
+            if len(bucket) < per_course_limit:
+                bucket.append(_task_from_doc(task))
+        
+        tasks = [task for cid in course_ids for task in tasks_by_course[cid]]
+        return tasks[:total_limit]
+
+    @staticmethod
+    def find_by_courses_between(course_ids: List[str], start: date, end: date) -> list:
+        """Find tasks dated start..end (inclusive) across several courses in one query.
+
+        Range-scans the (course_id, date) index - hinted, since course_completed_date
+        also matches and would scan both completion values per course. init_db
+        creates that index best-effort, so without it the query runs unhinted.
+        Tasks come back earliest first.
+        """
+        if not course_ids:
+            return []
+
+        cursor = study_tasks_collection.find(
+            {
+                "course_id": {"$in": [to_object_id(cid) for cid in course_ids]},
+                "date": {"$gte": to_bson_date(start), "$lte": to_bson_date(end)},
+            },
+            {**STUDY_TASK_LIST_PROJECTION, "course_id": 1}
+        ).sort("date", 1)
+        try:
+            # The hint is checked when the first batch is fetched, before any task is read
+            tasks = list(cursor.clone().hint([("course_id", 1), ("date", 1)]))
+        except OperationFailure:
+            tasks = list(cursor)
+        return [_task_from_doc(task) for task in tasks]
+
+    @staticmethod
+    def toggle_completed(task_id: str, course_ids: List[ObjectId]) -> Optional[bool]:
+        """Flip a task's completed flag atomically and return the new value.
+
+        The flip runs server-side as a pipeline update, so concurrent toggles
+        can't both read the same old value. Only a task in one of course_ids
+        matches, so ownership is checked by the same command. Returns None if
+        no task matched.
+        """
+        task = study_tasks_collection.find_one_and_update(
+            {"_id": to_object_id(task_id), "course_id": {"$in": course_ids}},
+            [{"$set": {"completed": {"$not": ["$completed"]}, "updated_at": "$$NOW"}}],
+            projection={"completed": 1},
+            return_document=ReturnDocument.AFTER
+        )
+        return task["completed"] if task else None
     
     @staticmethod
     def delete_by_course(course_id: str):
         """Delete all study tasks for a course."""
-        study_tasks_collection.delete_many({"course_id": ObjectId(course_id)})
+        _acknowledged_by_primary(study_tasks_collection).delete_many({"course_id": to_object_id(course_id)})
     
     @staticmethod
     def delete_by_material(material_id: str):
         """Remove material reference from tasks."""
-        study_tasks_collection.update_many(
-            {"material_id": ObjectId(material_id)},
+        _acknowledged_by_primary(study_tasks_collection).update_many(
+            {"material_id": to_object_id(material_id)},
             {"$set": {"material_id": None}}
         )
@@ -1,21 +1,38 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 import bcrypt
 import logging
+import os
 from models import User
 
 logger = logging.getLogger(__name__)
 
+# bcrypt is deliberately slow CPU work; lower BCRYPT_COST only for dev/test
+BCRYPT_COST = int(os.getenv("BCRYPT_COST", "12"))
+_bcrypt_pool = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+
+
+def _run_off_request_thread(fn, *args):
+    """Run a blocking bcrypt call on a native thread so the worker can serve other requests."""
+    try:
+        from gevent import monkey
+        if monkey.is_module_patched("threading"):
+            # Under gevent workers the stdlib pool is greenlet-based, which wouldn't
+            # help - use gevent's real OS thread pool instead
+            from gevent import get_hub
+            return get_hub().threadpool.apply(fn, args)
+    except ImportError:
+        pass
+    return _bcrypt_pool.submit(fn, *args).result()
+
 auth_bp = Blueprint("auth", __name__)
 
 
-@auth_bp.route("/register", methods=["POST", "OPTIONS"])
+@auth_bp.route("/register", methods=["POST"])
 def register():
     """Register a new user."""
-    if request.method == "OPTIONS":
-        return "", 200
-    
     try:
         logger.info(f"Register request from {request.remote_addr}")
         body = request.get_json() or {}
@@ -37,7 +54,10 @@ def register():
             return jsonify({"error": "Email already registered"}), 400
         
         # Hash password
-        password_hash = bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+        # Stored as raw bytes (BSON binary) so login can pass it to bcrypt as-is
+        password_hash = _run_off_request_thread(
+            bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(BCRYPT_COST)
+        )
         
         # Create user
         user = User.create(email=email, password_hash=password_hash, name=name)
@@ -63,12 +83,9 @@ def register():
         return jsonify({"error": f"Failed to register: {str(e)}"}), 500
 
 
-@auth_bp.route("/login", methods=["POST", "OPTIONS"])
+@auth_bp.route("/login", methods=["POST"])
 def login():
     """Login and get access token."""
-    if request.method == "OPTIONS":
-        return "", 200
-    
     try:
         logger.info(f"Login request from {request.remote_addr} for {request.get_json().get('email', 'unknown') if request.get_json() else 'unknown'}")
         body = request.get_json() or {}
@@ -84,10 +101,19 @@ def login():
         if not user:
             return jsonify({"error": "Invalid email or password"}), 401
         
-        # Verify password
-        if not bcrypt.checkpw(password.encode("utf-8"), user["password_hash"].encode("utf-8")):
+        # Verify password - older accounts stored the hash as a str
+        password_hash = user["password_hash"]
+        is_legacy_hash = isinstance(password_hash, str)
+        if is_legacy_hash:
+            password_hash = password_hash.encode("utf-8")
+        
+        if not _run_off_request_thread(bcrypt.checkpw, password.encode("utf-8"), password_hash):
             return jsonify({"error": "Invalid email or password"}), 401
         
+        if is_legacy_hash:
+            # Migrate to the bytes form so later logins skip the encode
+            User.update_password_hash(user["id"], password_hash)
+        
         # Create access token
         access_token = create_access_token(
             identity=str(user["_id"]),
@@ -135,14 +161,12 @@ def refresh():
     """Refresh access token."""
     try:
         user_id = get_jwt_identity()
-        user = User.find_by_id(user_id)
-        
-        if not user:
+        if not User.exists(user_id):
             return jsonify({"error": "User not found"}), 404
         
         # Create new access token
         access_token = create_access_token(
-            identity=str(user["_id"]),
+            identity=user_id,
             expires_delta=timedelta(days=30)
         )
         
@@ -1,13 +1,32 @@
-from flask import Blueprint, request, jsonify
-from models import Course, StudyTask
-from services.llm_service import chatbot_response
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from models import Course, StudyTask, utc_now
+from services.llm_service import chatbot_response, chatbot_response_stream
 from middleware import require_auth
 from bson import ObjectId
-from datetime import datetime
+import json
+
 
 chat_bp = Blueprint("chat", __name__)
 
 
+def _build_user_context(user_id):
+    """Courses and current study plans the chatbot is primed with."""
+    # Get user context (courses, current study plans)
+    courses = Course.find_by_user(user_id)
+    
+    # Get study tasks for context - limit to 5 courses and 10 tasks per course
+    all_tasks = StudyTask.find_by_courses(
+        [c["id"] for c in courses[:5]],
+        per_course_limit=10,
+        total_limit=20
+    )
+    
+    return {
+        "courses": courses[:5],
+        "study_tasks": all_tasks
+    }
+
+
 @chat_bp.route("/message", methods=["POST"])
 @require_auth
 def send_message(user_id):
@@ -20,26 +39,14 @@ def send_message(user_id):
         if not user_message:
             return jsonify({"error": "Message is required"}), 400
         
-        # Get user context (courses, current study plans)
-        courses = Course.find_by_user(user_id)
-        
-        # Get study tasks for context
-        all_tasks = []
-        for course in courses[:5]:  # Limit to 5 courses for context
-            tasks = StudyTask.find_by_course(course["id"])
-            all_tasks.extend(tasks[:10])  # Limit tasks per course
-        
-        user_context = {
-            "courses": courses[:5],
-            "study_tasks": all_tasks[:20]
-        }
+        user_context = _build_user_context(user_id)
         
         # Get AI response
         ai_response = chatbot_response(user_message, user_context, conversation_history)
         
         return jsonify({
             "response": ai_response,
-            "timestamp": datetime.utcnow().isoformat()
+            "timestamp": utc_now().isoformat()
         }), 200
     
     except Exception as e:
@@ -52,3 +59,38 @@ def send_message(user_id):
         if os.getenv("FLASK_ENV") == "production":
             return jsonify({"error": "Failed to get response. Please try again."}), 500
         return jsonify({"error": f"Failed to get response: {str(e)}"}), 500
+
+
+@chat_bp.route("/message/stream", methods=["POST"])
+@require_auth
+def stream_message(user_id):
+    """Send a message to the AI chatbot and stream the response as server-sent events.
+
+    Each event is a JSON object: {"delta": "..."} for every piece of the reply,
+    then {"done": true, "timestamp": "..."} once it is complete.
+    """
+    body = request.get_json() or {}
+    user_message = body.get("message", "").strip()
+    conversation_history = body.get("history", [])  # List of {role, content}
+    
+    if not user_message:
+        return jsonify({"error": "Message is required"}), 400
+    
+    try:
+        user_context = _build_user_context(user_id)
+    except Exception as e:
+        import logging
+        logging.getLogger(__name__).error(f"Error in chat endpoint: {e}", exc_info=True)
+        return jsonify({"error": "Failed to get response. Please try again."}), 500
+    
+    def events():
+        for piece in chatbot_response_stream(user_message, user_context, conversation_history):
+            yield f"data: {json.dumps({'delta': piece})}\n\n"
+        yield f"data: {json.dumps({'done': True, 'timestamp': utc_now().isoformat()})}\n\n"
+    
+    return Response(
+        stream_with_context(events()),
+        mimetype="text/event-stream",
+        # Stop proxies from buffering the stream, which would undo the early first byte
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
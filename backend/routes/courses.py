@@ -10,6 +10,15 @@ from middleware import require_auth
 courses_bp = Blueprint("courses", __name__)
 
 
+def _remove_file_quietly(file_path: str):
+    """Best-effort delete of an uploaded file - errors are logged, not raised."""
+    if os.path.exists(file_path):
+        try:
+            os.remove(file_path)
+        except Exception as e:
+            print(f"Error deleting file {file_path}: {e}")
+
+
 @courses_bp.route("", methods=["GET"])
 @require_auth
 def list_courses(user_id):
@@ -86,24 +95,18 @@ def delete_course(course_id, user_id):
         if not course:
             return jsonify({"error": "Course not found"}), 404
         
-        # Delete associated materials and their files
+        # Delete associated material files
         materials = Material.find_by_course(course_id)
-        for material in materials:
-            if material.get("file_path"):
-                upload_folder = current_app.config["UPLOAD_FOLDER"]
-                file_path = os.path.join(upload_folder, material["file_path"])
-                if os.path.exists(file_path):
-                    try:
-                        os.remove(file_path)
-                    except Exception as e:
-                        print(f"Error deleting file {file_path}: {e}")
+        upload_folder = current_app.config["UPLOAD_FOLDER"]
+        for m in materials:
+            if m.get("file_path"):
+                _remove_file_quietly(os.path.join(upload_folder, m["file_path"]))
         
         # Delete study tasks
         StudyTask.delete_by_course(course_id)
         
         # Delete materials
-        for material in materials:
-            Material.delete(material["id"])
+        Material.delete_by_course(course_id)
         
         # Delete the course
         success = Course.delete(course_id, user_id)
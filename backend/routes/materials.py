@@ -1,17 +1,32 @@
 from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
+from pymongo.errors import DuplicateKeyError
 import os
+import re
+import shutil
 
-from models import Material, Course, StudyTask
+from models import Material, Course
+from routes.courses import _remove_file_quietly
 from middleware import require_auth
 
 materials_bp = Blueprint("materials", __name__)
 
 ALLOWED_EXTENSIONS = {"pdf"}
+UPLOAD_CHUNK_SIZE = 64 * 1024
+# Suffixed titles tried before an upload is rejected as a conflict
+MAX_TITLE_ATTEMPTS = 10
+# Key of the course_title_unique index, as reported in DuplicateKeyError details
+_COURSE_TITLE_KEY = {"course_id": 1, "title": 1}
+
+# Matches a filename ending in any allowed extension, case-insensitively
+_ALLOWED_EXTENSION_RE = re.compile(
+    r"\.(?:" + "|".join(re.escape(ext) for ext in sorted(ALLOWED_EXTENSIONS)) + r")$",
+    re.IGNORECASE
+)
 
 
 def allowed_file(filename: str) -> bool:
-    return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
+    return bool(_ALLOWED_EXTENSION_RE.search(filename))
 
 
 @materials_bp.route("/<string:course_id>", methods=["GET"])
@@ -72,50 +87,79 @@ def upload_material(user_id):
         os.makedirs(upload_folder, exist_ok=True)
         file_path = os.path.join(upload_folder, filename)
 
-        # Avoid overwriting: if file exists, add suffix
+        # Avoid overwriting: create the file exclusively and add a suffix if it exists.
+        # This replaces a separate exists() check per candidate name and closes the
+        # race between checking and saving.
         base, ext = os.path.splitext(filename)
         counter = 1
-        while os.path.exists(file_path):
-            filename = f"{base}_{counter}{ext}"
-            file_path = os.path.join(upload_folder, filename)
-            counter += 1
-
-        file.save(file_path)
+        while True:
+            try:
+                dst = open(file_path, "xb")
+                break
+            except FileExistsError:
+                filename = f"{base}_{counter}{ext}"
+                file_path = os.path.join(upload_folder, filename)
+                counter += 1
+        # Stream to disk in fixed-size chunks so memory use doesn't grow with the PDF
+        with dst:
+            shutil.copyfileobj(file.stream, dst, UPLOAD_CHUNK_SIZE)
 
         # Extract text and analyze PDF structure
         raw_text = ""
         pdf_structure = None
         try:
-            from services.pdf_analyzer import analyze_pdf_structure
-            pdf_structure = analyze_pdf_structure(file_path)
-            
-            # Extract full text for backward compatibility
             from pypdf import PdfReader
+            from services.pdf_analyzer import analyze_pdf_structure, extract_page_texts
+            
+            # Parse the PDF and extract each page's text once, shared by the
+            # structure analysis and raw_text
             reader = PdfReader(file_path)
-            pages_text = []
-            for page in reader.pages:
-                txt = page.extract_text() or ""
-                pages_text.append(txt)
-            raw_text = "\n".join(pages_text)
+            page_texts = extract_page_texts(file_path, reader)
+            pdf_structure = analyze_pdf_structure(file_path, reader=reader, page_texts=page_texts)
+            raw_text = "\n".join(page_texts)
         except Exception as e:
             raw_text = ""
             print("Error reading PDF:", e)
             import traceback
             traceback.print_exc()
 
-        # Store structured content in metadata_json
+        # Store sections as a native array for the planners; the rest of the
+        # structure goes in metadata_json
         metadata_json = None
+        sections = None
         if pdf_structure:
             import json
-            metadata_json = json.dumps(pdf_structure)
-
-        material = Material.create(
-            course_id=course_id,
-            title=file.filename,
-            file_path=filename,
-            raw_text=raw_text,
-            metadata_json=metadata_json,
-        )
+            sections = pdf_structure["sections"]
+            metadata_json = json.dumps({k: v for k, v in pdf_structure.items() if k != "sections"})
+
+        # Titles are unique per course (enforced by the course_title_unique index) -
+        # suffix the title if this course already has a material with it
+        title = file.filename
+        title_base, title_ext = os.path.splitext(title)
+        # The file is already on disk - remove it on every path that stores no material
+        try:
+            for attempt in range(1, MAX_TITLE_ATTEMPTS + 1):
+                try:
+                    material = Material.create(
+                        course_id=course_id,
+                        title=title,
+                        file_path=filename,
+                        raw_text=raw_text,
+                        metadata_json=metadata_json,
+                        sections=sections,
+                    )
+                    break
+                except DuplicateKeyError as e:
+                    # Only a title clash is retried; any other unique index is a real error
+                    if (e.details or {}).get("keyPattern") != _COURSE_TITLE_KEY:
+                        raise
+                    title = f"{title_base}_{attempt}{title_ext}"
+            else:
+                _remove_file_quietly(file_path)
+                return jsonify({"error": "A material with this title already exists"}), 409
+        except Exception:
+            _remove_file_quietly(file_path)
+            raise
 
         return jsonify(
             {
@@ -133,15 +177,13 @@ def upload_material(user_id):
 def delete_material(material_id, user_id):
     """Delete a material and its associated file."""
     try:
-        material = Material.find_by_id(material_id)
+        # Material and its course's owner in one round trip
+        material = Material.find_with_owner(material_id)
         if not material:
             return jsonify({"error": "Material not found"}), 404
         
         # Verify course belongs to user
-        from bson import ObjectId
-        course_id_str = str(material["course_id"]) if isinstance(material["course_id"], ObjectId) else material["course_id"]
-        course = Course.find_by_id(course_id_str, user_id)
-        if not course:
+        if material["owner_id"] != user_id:
             return jsonify({"error": "Unauthorized"}), 403
         
         # Delete the physical file if it exists
@@ -154,11 +196,8 @@ def delete_material(material_id, user_id):
                 except Exception as e:
                     print(f"Error deleting file {file_path}: {e}")
         
-        # Remove material reference from study tasks
-        StudyTask.delete_by_material(material_id)
-        
-        # Delete the database record
-        success = Material.delete(material_id)
+        # Remove material reference from study tasks and delete the database record
+        success = Material.delete_with_tasks(material_id)
         
         if not success:
             return jsonify({"error": "Failed to delete material"}), 500
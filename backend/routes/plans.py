@@ -1,13 +1,11 @@
+from concurrent.futures import ThreadPoolExecutor
 from flask import Blueprint, jsonify
 from models import Course, StudyTask
 from services.ai_planner import generate_ai_study_plan
 from middleware import require_auth
-from datetime import date, datetime
+from datetime import date, timedelta
 from bson import ObjectId
 
-# Import collection directly
-from models import study_tasks_collection
-
 plans_bp = Blueprint("plans", __name__)
 
 
@@ -17,8 +15,7 @@ def get_plan(course_id, user_id):
     """Return all study tasks for a given course."""
     try:
         # Verify course belongs to user
-        course = Course.find_by_id(course_id, user_id)
-        if not course:
+        if not Course.is_owned_by(course_id, user_id):
             return jsonify({"error": "Course not found"}), 404
         
         tasks = StudyTask.find_by_course(course_id)
@@ -48,21 +45,14 @@ def generate_plan(course_id, user_id):
         if not course:
             return jsonify({"error": "Course not found"}), 404
         
-        # Delete existing tasks
-        StudyTask.delete_by_course(course_id)
+        # Delete existing tasks while the new AI-powered tasks are generated -
+        # the delete doesn't depend on the plan, so its round trip overlaps the LLM calls
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            deleted = executor.submit(StudyTask.delete_by_course, course_id)
+            new_tasks = generate_ai_study_plan(course)
+            deleted.result()
         
-        # Generate new AI-powered tasks
-        new_tasks = generate_ai_study_plan(course)
-        for t in new_tasks:
-            task_date = date.fromisoformat(t["date"])
-            StudyTask.create(
-                course_id=course_id,
-                date=task_date,
-                title=t["title"],
-                description=t.get("description"),
-                completed=t.get("completed", False),
-                material_id=t.get("material_id"),
-            )
+        StudyTask.create_many(course_id, new_tasks)
 
         return jsonify({"created": len(new_tasks)}), 201
     except Exception as e:
@@ -74,64 +64,56 @@ def generate_plan(course_id, user_id):
 def get_today_plan(user_id):
     """Get today's study plan across all courses."""
     try:
-        from datetime import timedelta
         # Get today's date in server timezone - frontend will filter by user's local date
         today_dt = date.today()
         today_str = today_dt.isoformat()
         
         # Get all user's courses
         courses = Course.find_by_user(user_id)
+        course_names = {course["id"]: course["name"] for course in courses}
         
         # Return tasks from yesterday to 4 days ahead to ensure we catch "today" in any timezone
         # Frontend will filter based on user's local date
-        date_range_start = (today_dt - timedelta(days=1)).isoformat()
-        date_range_end = (today_dt + timedelta(days=4)).isoformat()
+        tasks = StudyTask.find_by_courses_between(
+            list(course_names),
+            today_dt - timedelta(days=1),
+            today_dt + timedelta(days=4),
+        )
         
         today_tasks = []
-        for course in courses:
-            tasks = StudyTask.find_by_course(course["id"])
-            for task in tasks:
-                task_date_str = task.get("date")
-                if task_date_str:
-                    # Include tasks within date range (frontend filters by local date)
-                    if date_range_start <= task_date_str <= date_range_end:
-                        task_dict = {
-                            "id": task["id"],
-                            "courseId": course["id"],
-                            "courseName": course["name"],
-                            "date": task["date"],
-                            "title": task["title"],
-                            "description": task.get("description"),
-                            "completed": task.get("completed", False),
-                        }
-                        today_tasks.append(task_dict)
-        
-        # Also get upcoming tasks (next 3 days) for context
+        # Also get upcoming tasks (next 3 days) for context - ISO dates compare in date order
+        upcoming_start = (today_dt + timedelta(days=1)).isoformat()
+        upcoming_end = (today_dt + timedelta(days=3)).isoformat()
         upcoming_tasks = []
-        for course in courses:
-            tasks = StudyTask.find_by_course(course["id"])
-            for task in tasks:
-                task_date_str = task.get("date")
-                if task_date_str:
-                    try:
-                        task_date = date.fromisoformat(task_date_str)
-                        today_dt = date.today()
-                        days_ahead = (task_date - today_dt).days
-                        if 1 <= days_ahead <= 3:
-                            upcoming_tasks.append({
-                                "id": task["id"],
-                                "courseId": course["id"],
-                                "courseName": course["name"],
-                                "date": task_date_str,
-                                "title": task["title"],
-                                "daysAhead": days_ahead,
-                            })
-                    except:
-                        pass
+        for task in tasks:
+            course_id = str(task["course_id"])
+            today_tasks.append({
+                "id": task["id"],
+                "courseId": course_id,
+                "courseName": course_names[course_id],
+                "date": task["date"],
+                "title": task["title"],
+                "description": task.get("description"),
+                "completed": task.get("completed", False),
+            })
+            
+            if upcoming_start <= task["date"] <= upcoming_end:
+                upcoming_tasks.append({
+                    "id": task["id"],
+                    "courseId": course_id,
+                    "courseName": course_names[course_id],
+                    "date": task["date"],
+                    "title": task["title"],
+                })
+        
+        # Tasks arrive sorted by date, so the first five upcoming are the soonest
+        upcoming_tasks = upcoming_tasks[:5]
+        for task in upcoming_tasks:
+            task["daysAhead"] = (date.fromisoformat(task["date"]) - today_dt).days
         
         return jsonify({
             "today": today_tasks,
-            "upcoming": sorted(upcoming_tasks, key=lambda x: x["daysAhead"])[:5],
+            "upcoming": upcoming_tasks,
             "date": today_str
         }), 200
     
@@ -144,24 +126,14 @@ def get_today_plan(user_id):
 def toggle_task_completion(task_id, user_id):
     """Toggle completion status of a study task."""
     try:
-        from models import study_tasks_collection
-        
-        # Verify task exists and belongs to user's course
-        task = study_tasks_collection.find_one({"_id": ObjectId(task_id)})
-        if not task:
+        if not ObjectId.is_valid(task_id):
             return jsonify({"error": "Task not found"}), 404
         
-        # Verify course belongs to user
-        course = Course.find_by_id(str(task["course_id"]), user_id)
-        if not course:
-            return jsonify({"error": "Unauthorized"}), 403
-        
-        # Toggle completion
-        new_completed = not task.get("completed", False)
-        study_tasks_collection.update_one(
-            {"_id": ObjectId(task_id)},
-            {"$set": {"completed": new_completed, "updated_at": datetime.utcnow()}}
-        )
+        # Toggle completion - the update only matches a task in one of the
+        # user's courses, so a task owned by someone else reads as not found
+        new_completed = StudyTask.toggle_completed(task_id, Course.ids_by_user(user_id))
+        if new_completed is None:
+            return jsonify({"error": "Task not found"}), 404
         
         return jsonify({"completed": new_completed}), 200
     
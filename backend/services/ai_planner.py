@@ -1,16 +1,26 @@
 """
 AI-Enhanced Study Planner using LLM for intelligent plan generation.
 """
-from datetime import date, timedelta
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
 from typing import List, Dict, Optional
-import json
 from models import Material
 from services.llm_service import (
+    TOPIC_TOKEN_BUDGET,
+    truncate_and_count_tokens,
     generate_study_plan_with_ai,
-    extract_topics_with_ai,
+    extract_topics_batch,
     analyze_syllabus_for_schedule
 )
 from services.pdf_analyzer import split_content_for_study
+from services.planner import _calculate_session_dates, _session_count
+
+# Concurrent OpenAI calls per plan generation
+AI_EXTRACTION_WORKERS = 8
+# Topics and sections passed to the plan-generation prompt
+MAX_PLAN_TOPICS = 20
+MAX_PLAN_SECTIONS = 10
 
 
 def generate_ai_study_plan(course: Dict) -> List[Dict]:
@@ -25,7 +35,7 @@ def generate_ai_study_plan(course: Dict) -> List[Dict]:
     
     try:
         end = date.fromisoformat(end_str) if end_str else start
-    except:
+    except ValueError:
         end = start
     
     if end < start:
@@ -35,59 +45,89 @@ def generate_ai_study_plan(course: Dict) -> List[Dict]:
     if total_days <= 0:
         total_days = 1
 
+    # Determine number of sessions
+    num_sessions = _session_count(total_days)
+    # The plan uses at most this many topics and sections (sections are matched to
+    # sessions by index), so materials past that point are not analyzed
+    section_limit = max(MAX_PLAN_SECTIONS, num_sessions)
+
     course_id = course["id"]
-    materials = Material.find_by_course(course_id)
+    materials = Material.iter_by_course(course_id)
     
     # Extract topics using AI
     all_topics = []
     all_sections = []
     syllabus_data = {}
     
-    for material in materials:
-        # Use AI to extract topics from PDF text
-        if material.get("raw_text"):
-            ai_topics = extract_topics_with_ai(material["raw_text"], course.get("name", ""))
-            all_topics.extend(ai_topics)
+    # The LLM calls for different materials are independent network waits, so run them concurrently
+    with ThreadPoolExecutor(max_workers=AI_EXTRACTION_WORKERS) as executor:
+        topic_futures = deque()  # in flight, oldest first
+        syllabus_future = None
+        # Small materials are packed into shared topic-extraction calls up to the token budget
+        pending_texts = []
+        pending_tokens = 0
+        
+        def collect_oldest_topics():
+            # Collect in material order so the plan doesn't depend on which call finished first
+            for topics in topic_futures.popleft().result():
+                all_topics.extend(topics)
+        
+        def submit_pending_topics():
+            # Keep at most AI_EXTRACTION_WORKERS batches in flight; the oldest
+            # result tells whether more topics are still needed
+            if len(topic_futures) >= AI_EXTRACTION_WORKERS:
+                collect_oldest_topics()
+            if len(all_topics) < MAX_PLAN_TOPICS:
+                topic_futures.append(executor.submit(extract_topics_batch, pending_texts, course.get("name", "")))
+        
+        for material in materials:
+            topics_needed = len(all_topics) < MAX_PLAN_TOPICS
+            if not topics_needed and len(all_sections) >= section_limit:
+                break
+            
+            # Use AI to extract topics from PDF text
+            if material.get("raw_text"):
+                if topics_needed and len(material["raw_text"].strip()) >= 100:
+                    text, tokens = truncate_and_count_tokens(material["raw_text"], TOPIC_TOKEN_BUDGET, "gpt-4o-mini")
+                    if pending_texts and pending_tokens + tokens > TOPIC_TOKEN_BUDGET:
+                        submit_pending_topics()
+                        pending_texts, pending_tokens = [], 0
+                    pending_texts.append(text)
+                    pending_tokens += tokens
+                
+                # Analyze syllabus for schedule if it looks like a syllabus
+                if "syllabus" in material.get("title", "").lower() or "course outline" in material.get("title", "").lower():
+                    syllabus_future = executor.submit(analyze_syllabus_for_schedule, material["raw_text"])
             
-            # Analyze syllabus for schedule if it looks like a syllabus
-            if "syllabus" in material.get("title", "").lower() or "course outline" in material.get("title", "").lower():
-                syllabus_data = analyze_syllabus_for_schedule(material["raw_text"])
+            # Get structured sections from PDF
+            if len(all_sections) < section_limit and (material.get("sections") or material.get("metadata_json")):
+                try:
+                    sections = Material.sections_of(material)[:section_limit - len(all_sections)]
+                    if sections:
+                        all_sections.extend(sections)
+                        for section in sections:
+                            section["materialId"] = material["id"]
+                            section["materialTitle"] = material["title"]
+                except Exception as e:
+                    print(f"Error parsing PDF structure: {e}")
         
-        # Get structured sections from PDF
-        if material.get("metadata_json"):
-            try:
-                pdf_structure = json.loads(material["metadata_json"])
-                sections = pdf_structure.get("sections", [])
-                if sections:
-                    all_sections.extend(sections)
-                    for section in sections:
-                        section["materialId"] = material["id"]
-                        section["materialTitle"] = material["title"]
-            except Exception as e:
-                print(f"Error parsing PDF structure: {e}")
-
-    # Determine number of sessions
-    if total_days <= 7:
-        num_sessions = min(3, total_days)
-    elif total_days <= 30:
-        num_sessions = min(8, total_days // 3)
-    elif total_days <= 60:
-        num_sessions = min(12, total_days // 5)
-    else:
-        num_sessions = min(16, total_days // 7)
-    
-    if num_sessions <= 0:
-        num_sessions = 1
+        if pending_texts:
+            submit_pending_topics()
+        
+        while topic_futures:
+            collect_oldest_topics()
+        if syllabus_future is not None:
+            syllabus_data = syllabus_future.result()
 
     # Calculate session dates with spaced repetition
-    session_dates = _calculate_session_dates(start, end, num_sessions, exam_date)
+    session_dates = _calculate_session_dates(start, end, num_sessions, exam_date, fill_gaps=False)
     
     # Generate AI study plan
     try:
         ai_sessions = generate_study_plan_with_ai(
             course,
-            all_topics[:20],
-            all_sections[:10],
+            all_topics[:MAX_PLAN_TOPICS],
+            all_sections[:MAX_PLAN_SECTIONS],
             num_sessions
         )
         
@@ -114,7 +154,7 @@ def generate_ai_study_plan(course: Dict) -> List[Dict]:
             
             tasks.append({
                 "course_id": course_id,
-                "date": session_date.isoformat(),
+                "date": session_date,
                 "title": title,
                 "description": description,
                 "completed": False,
@@ -127,53 +167,6 @@ def generate_ai_study_plan(course: Dict) -> List[Dict]:
         return _generate_fallback_plan(course, session_dates, all_topics, all_sections)
 
 
-def _calculate_session_dates(start: date, end: date, num_sessions: int, exam_date: date = None) -> List[date]:
-    """Calculate session dates using spaced repetition."""
-    total_days = (end - start).days + 1
-    if total_days <= 1:
-        return [start]
-
-    dates = []
-    
-    if exam_date and num_sessions > 4:
-        # Two-phase: regular spacing early, intensive near exam
-        exam_prep_days = min(14, (end - exam_date).days) if exam_date else 0
-        early_sessions = max(1, num_sessions // 2)
-        prep_sessions = num_sessions - early_sessions
-        
-        early_end = max(start, exam_date - timedelta(days=exam_prep_days + 1))
-        early_days = (early_end - start).days + 1
-        if early_days > 0:
-            early_step = max(1, early_days // max(1, early_sessions))
-            for i in range(early_sessions):
-                day_offset = i * early_step
-                session_date = start + timedelta(days=day_offset)
-                if session_date <= early_end:
-                    dates.append(session_date)
-        
-        prep_start = max(dates[-1] + timedelta(days=3), exam_date - timedelta(days=exam_prep_days)) if dates else exam_date - timedelta(days=exam_prep_days)
-        prep_end = exam_date - timedelta(days=1)
-        prep_days = (prep_end - prep_start).days + 1
-        if prep_days > 0:
-            prep_step = max(1, prep_days // max(1, prep_sessions))
-            for i in range(prep_sessions):
-                day_offset = i * prep_step
-                session_date = prep_start + timedelta(days=day_offset)
-                if session_date < exam_date and session_date not in dates:
-                    dates.append(session_date)
-    else:
-        # Simple exponential spacing
-        for i in range(num_sessions):
-            progress = (i + 1) / num_sessions
-            day_position = int(total_days * (progress ** 1.5))
-            session_date = start + timedelta(days=min(day_position, total_days - 1))
-            if session_date not in dates:
-                dates.append(session_date)
-
-    dates = sorted(set(dates))
-    return dates[:num_sessions]
-
-
 def _generate_fallback_plan(
     course: Dict,
     session_dates: List[date],
@@ -198,7 +191,7 @@ def _generate_fallback_plan(
         
         tasks.append({
             "course_id": course_id,
-            "date": session_date.isoformat(),
+            "date": session_date,
             "title": title,
             "description": description,
             "completed": False,
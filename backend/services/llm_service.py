@@ -1,8 +1,10 @@
+import hashlib
+import json
 import os
-from typing import List, Dict, Optional
-from openai import OpenAI
-import tiktoken
+from functools import lru_cache
+from typing import List, Dict, Iterator, Optional, Tuple
 from dotenv import load_dotenv
+from models import TTLCache
 
 # Load environment variables
 load_dotenv()
@@ -17,37 +19,61 @@ def get_openai_client():
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("OPENAI_API_KEY environment variable not set")
+        # Imported lazily - the OpenAI SDK is slow to import and only needed once a request hits the LLM
+        from openai import OpenAI
         client = OpenAI(api_key=api_key)
     return client
 
 
+@lru_cache(maxsize=8)
+def _get_encoding(model: str):
+    """Return the tiktoken encoding for a model, built once per model."""
+    import tiktoken
+    return tiktoken.encoding_for_model(model)
+
+
 def count_tokens(text: str, model: str = "gpt-4") -> int:
     """Count tokens in text for a given model."""
     try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
-    except:
+        return len(_get_encoding(model).encode(text, disallowed_special=()))
+    except Exception:
         # Fallback: rough estimate (1 token ≈ 4 characters)
         return len(text) // 4
 
 
 def truncate_to_token_limit(text: str, max_tokens: int, model: str = "gpt-4") -> str:
     """Truncate text to fit within token limit."""
-    tokens = count_tokens(text, model)
-    if tokens <= max_tokens:
+    # Every BPE token covers at least one UTF-8 byte and a character is at most 4 bytes,
+    # so short text is under budget without tokenizing it
+    if len(text) * 4 <= max_tokens:
         return text
+    return truncate_and_count_tokens(text, max_tokens, model)[0]
+
+
+def truncate_and_count_tokens(text: str, max_tokens: int, model: str = "gpt-4") -> Tuple[str, int]:
+    """Truncate text to fit within token limit and return it with its token count.
+
+    Tokenizes once, so callers that budget by tokens don't need count_tokens afterwards.
+    """
+    try:
+        encoding = _get_encoding(model)
+    except Exception:
+        # Fallback: rough estimate (1 token ≈ 4 characters)
+        text = text[:max_tokens * 4]
+        return text, len(text) // 4
     
-    # Estimate characters per token
-    ratio = len(text) / tokens
-    max_chars = int(max_tokens * ratio * 0.9)  # 90% safety margin
-    return text[:max_chars]
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text, len(tokens)
+    return encoding.decode(tokens[:max_tokens]), max_tokens
 
 
 def chat_completion(
     messages: List[Dict[str, str]],
     model: str = "gpt-4o-mini",
     temperature: float = 0.7,
-    max_tokens: int = 1000
+    max_tokens: int = 1000,
+    response_format: Optional[Dict] = None
 ) -> str:
     """
     Send messages to OpenAI and get completion.
@@ -59,6 +85,7 @@ def chat_completion(
         model: Model to use (gpt-4o-mini for cost efficiency, gpt-4o for best quality)
         temperature: Sampling temperature (0-2)
         max_tokens: Maximum tokens in response
+        response_format: e.g. {"type": "json_object"} to force a valid JSON reply
     
     Returns:
         Response text from the model
@@ -68,12 +95,14 @@ def chat_completion(
     
     try:
         openai_client = get_openai_client()
+        extra_args = {"response_format": response_format} if response_format else {}
         response = openai_client.chat.completions.create(
             model=model,
             messages=messages,
             temperature=temperature,
             max_tokens=max_tokens,
-            timeout=30.0  # 30 second timeout
+            timeout=30.0,  # 30 second timeout
+            **extra_args
         )
         return response.choices[0].message.content
     except Exception as e:
@@ -85,6 +114,77 @@ def chat_completion(
         raise
 
 
+def stream_chat_completion(
+    messages: List[Dict[str, str]],
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.7,
+    max_tokens: int = 1000
+) -> Iterator[str]:
+    """
+    Like chat_completion(), but yields the response text piece by piece as
+    OpenAI generates it, so callers can forward the first tokens immediately.
+    """
+    import logging
+    logger = logging.getLogger(__name__)
+    
+    try:
+        openai_client = get_openai_client()
+        stream = openai_client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            timeout=30.0,  # 30 second timeout
+            stream=True
+        )
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        logger.error(f"Error in OpenAI API call: {e}", exc_info=True)
+        # Don't expose internal errors to users in production
+        if os.getenv("FLASK_ENV") == "production":
+            raise Exception("AI service temporarily unavailable. Please try again.")
+        raise
+
+
+# Forces the model to reply with a syntactically valid JSON object
+JSON_RESPONSE_FORMAT = {"type": "json_object"}
+
+# Completions for deterministic analysis prompts, keyed by a hash of the full request
+_completion_cache = TTLCache(maxsize=512, ttl=86400)
+
+
+def cached_chat_completion(
+    kind: str,
+    messages: List[Dict[str, str]],
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.7,
+    max_tokens: int = 1000,
+    response_format: Optional[Dict] = None
+) -> str:
+    """
+    chat_completion() memoized on kind, model, sampling settings and messages.
+    Re-generating a plan for unchanged materials reuses the earlier responses
+    instead of calling OpenAI again. Failed calls are not cached.
+    """
+    payload = json.dumps([kind, model, temperature, max_tokens, response_format, messages], separators=(",", ":"))
+    key = hashlib.sha256(payload.encode("utf-8")).hexdigest()
+    
+    response = _completion_cache.get(key)
+    if response is None:
+        response = chat_completion(
+            messages, model=model, temperature=temperature, max_tokens=max_tokens,
+            response_format=response_format
+        )
+        _completion_cache.set(key, response)
+    return response
+
+
+# Material text tokens sent per topic-extraction call
+TOPIC_TOKEN_BUDGET = 12000
+
+
 def extract_topics_with_ai(pdf_text: str, course_name: str = "") -> List[str]:
     """
     Use AI to extract topics and chapters from PDF text.
@@ -94,8 +194,12 @@ def extract_topics_with_ai(pdf_text: str, course_name: str = "") -> List[str]:
         return []
     
     # Truncate to fit context window (leave room for prompt and response)
-    truncated_text = truncate_to_token_limit(pdf_text, 12000, "gpt-4o-mini")
-    
+    truncated_text = truncate_to_token_limit(pdf_text, TOPIC_TOKEN_BUDGET, "gpt-4o-mini")
+    return _extract_topics_from_truncated(truncated_text, course_name)
+
+
+def _extract_topics_from_truncated(truncated_text: str, course_name: str) -> List[str]:
+    """extract_topics_with_ai for text already within TOPIC_TOKEN_BUDGET."""
     prompt = f"""Analyze the following course material{' for ' + course_name if course_name else ''} and extract a comprehensive list of topics, chapters, and key concepts.
 
 Extract:
@@ -122,7 +226,7 @@ Topics:"""
             }
         ]
         
-        response = chat_completion(messages, model="gpt-4o-mini", temperature=0.3, max_tokens=1000)
+        response = cached_chat_completion("topics", messages, model="gpt-4o-mini", temperature=0.3, max_tokens=1000)
         
         # Parse response into list
         topics = []
@@ -139,6 +243,60 @@ Topics:"""
         return []
 
 
+def extract_topics_batch(pdf_texts: List[str], course_name: str = "") -> List[List[str]]:
+    """
+    Extract topics for several materials with a single AI call.
+    
+    The texts should already be truncated so that together they fit within
+    TOPIC_TOKEN_BUDGET. Returns one topic list per text, in the same order.
+    """
+    if len(pdf_texts) == 1:
+        return [_extract_topics_from_truncated(pdf_texts[0], course_name)]
+    
+    materials_text = "\n---\n".join(
+        f"Material {i}:\n{text}" for i, text in enumerate(pdf_texts, 1)
+    )
+    
+    prompt = f"""Analyze the following {len(pdf_texts)} course materials{' for ' + course_name if course_name else ''} and, for each material, extract a comprehensive list of topics, chapters, and key concepts.
+
+Extract:
+1. Main topics/chapters (numbered sections, unit titles, etc.)
+2. Key concepts and themes
+3. Important subject areas
+
+Return ONLY a JSON object mapping each material number to its list of topics, e.g. {{"1": ["Topic", ...], "2": [...]}}. Be specific and concise. Include 10-20 of the most important topics per material.
+
+{materials_text}"""
+
+    try:
+        messages = [
+            {
+                "role": "system",
+                "content": "You are an expert at analyzing academic course materials and extracting structured topics and concepts. Always return valid JSON."
+            },
+            {
+                "role": "user",
+                "content": prompt
+            }
+        ]
+        
+        response = cached_chat_completion(
+            "topics_batch", messages, model="gpt-4o-mini", temperature=0.3,
+            max_tokens=min(4000, 1000 * len(pdf_texts)), response_format=JSON_RESPONSE_FORMAT
+        )
+        
+        topics_by_material = json.loads(response)
+        results = []
+        for i in range(1, len(pdf_texts) + 1):
+            topics = topics_by_material.get(str(i)) or []
+            topics = [t.strip() for t in topics if isinstance(t, str) and 5 < len(t.strip()) < 100]
+            results.append(topics[:20])  # Limit to 20 topics per material
+        return results
+    except Exception as e:
+        print(f"Error extracting topics with AI: {e}")
+        return [[] for _ in pdf_texts]
+
+
 def generate_study_plan_with_ai(
     course_info: Dict,
     topics: List[str],
@@ -183,13 +341,13 @@ Generate {num_sessions} study sessions with:
 Distribute sessions using spaced repetition (more frequent near exam). Make sessions practical and actionable.
 Include a mix of: reading, note-taking, practice problems, review, and exam prep.
 
-Return ONLY a JSON array of objects, each with "title" and "description" fields. No other text.
+Return ONLY a JSON object with a "sessions" array of objects, each with "title" and "description" fields. No other text.
 
 Format:
-[
+{{"sessions": [
   {{"title": "Session title", "description": "Detailed study activities and instructions"}},
   ...
-]"""
+]}}"""
 
     try:
         messages = [
@@ -203,21 +361,12 @@ Format:
             }
         ]
         
-        response = chat_completion(messages, model="gpt-4o-mini", temperature=0.7, max_tokens=2000)
-        
-        # Parse JSON response
-        import json
-        # Try to extract JSON from response (in case there's extra text)
-        response = response.strip()
-        if response.startswith('```json'):
-            response = response[7:]
-        if response.startswith('```'):
-            response = response[3:]
-        if response.endswith('```'):
-            response = response[:-3]
-        response = response.strip()
+        response = cached_chat_completion(
+            "study_plan", messages, model="gpt-4o-mini", temperature=0.7, max_tokens=2000,
+            response_format=JSON_RESPONSE_FORMAT
+        )
         
-        sessions = json.loads(response)
+        sessions = json.loads(response).get("sessions")
         if isinstance(sessions, list):
             return sessions[:num_sessions]
         return []
@@ -226,22 +375,15 @@ Format:
         return []
 
 
-def chatbot_response(
+CHATBOT_ERROR_MESSAGE = "I apologize, but I'm having trouble processing your request right now. Please try again."
+
+
+def _chatbot_messages(
     user_message: str,
     user_context: Dict,
     conversation_history: List[Dict[str, str]] = None
-) -> str:
-    """
-    Generate chatbot response using AI.
-    
-    Args:
-        user_message: User's message
-        user_context: Dict with user's courses, study plans, etc.
-        conversation_history: Previous messages in conversation
-    
-    Returns:
-        AI response text
-    """
+) -> List[Dict[str, str]]:
+    """Build the chatbot prompt: system prompt with course context, recent history, new message."""
     conversation_history = conversation_history or []
     
     # Build system prompt with context
@@ -269,6 +411,26 @@ Be helpful, encouraging, and practical. Keep responses concise but informative.
     
     # Add current user message
     messages.append({"role": "user", "content": user_message})
+    return messages
+
+
+def chatbot_response(
+    user_message: str,
+    user_context: Dict,
+    conversation_history: List[Dict[str, str]] = None
+) -> str:
+    """
+    Generate chatbot response using AI.
+    
+    Args:
+        user_message: User's message
+        user_context: Dict with user's courses, study plans, etc.
+        conversation_history: Previous messages in conversation
+    
+    Returns:
+        AI response text
+    """
+    messages = _chatbot_messages(user_message, user_context, conversation_history)
     
     try:
         response = chat_completion(
@@ -280,7 +442,29 @@ Be helpful, encouraging, and practical. Keep responses concise but informative.
         return response
     except Exception as e:
         print(f"Error in chatbot: {e}")
-        return "I apologize, but I'm having trouble processing your request right now. Please try again."
+        return CHATBOT_ERROR_MESSAGE
+
+
+def chatbot_response_stream(
+    user_message: str,
+    user_context: Dict,
+    conversation_history: List[Dict[str, str]] = None
+) -> Iterator[str]:
+    """
+    Streaming variant of chatbot_response(): yields the reply as it is generated.
+    If the call fails before anything was sent, yields the usual apology instead.
+    """
+    messages = _chatbot_messages(user_message, user_context, conversation_history)
+    
+    sent_any = False
+    try:
+        for piece in stream_chat_completion(messages, model="gpt-4o-mini", temperature=0.8, max_tokens=500):
+            sent_any = True
+            yield piece
+    except Exception as e:
+        print(f"Error in chatbot: {e}")
+        if not sent_any:
+            yield CHATBOT_ERROR_MESSAGE
 
 
 def analyze_syllabus_for_schedule(pdf_text: str) -> Dict:
@@ -317,15 +501,10 @@ Syllabus:
             }
         ]
         
-        response = chat_completion(messages, model="gpt-4o-mini", temperature=0.3, max_tokens=1500)
-        
-        # Parse JSON
-        import json
-        response = response.strip()
-        if '```json' in response:
-            response = response.split('```json')[1].split('```')[0].strip()
-        elif '```' in response:
-            response = response.split('```')[1].split('```')[0].strip()
+        response = cached_chat_completion(
+            "syllabus", messages, model="gpt-4o-mini", temperature=0.3, max_tokens=1500,
+            response_format=JSON_RESPONSE_FORMAT
+        )
         
         return json.loads(response)
     except Exception as e:
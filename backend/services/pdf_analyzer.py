@@ -1,8 +1,38 @@
 import json
+import multiprocessing
+import os
 import re
-from typing import List, Dict, Tuple
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from itertools import chain, islice
+from typing import List, Dict, Tuple, Iterable, Iterator, Optional
 from pypdf import PdfReader
 
+# Compiled once at import - the section/topic scans run these on every page and section
+_NUMBERED_TOPIC_RE = re.compile(r'^\s*\d+[\.\)]\s+([A-Z][^\n]{5,60})', re.MULTILINE)
+_CAPITALIZED_PHRASE_RE = re.compile(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,3})\b')
+_KEY_TERM_RE = re.compile(r'\b([A-Z][A-Za-z]{3,20}(?:\s+[A-Z][A-Za-z]{2,15}){0,2})\b')
+
+# Section headers in one scan over a page's first lines, in priority order per line:
+# numbered ("1. Title", "Chapter 2: Title"), all caps, or title case ending in a colon.
+# The caps branch only pre-filters (no ASCII lowercase); str.isupper() confirms it.
+_SECTION_HEADER_RE = re.compile(
+    r'^(?:'
+    r'(?i:(?:Chapter|Section|Part)?[^\S\n]*\d+[\.:][^\S\n]+)(?P<numbered>(?i:[A-Z])[^\n]{5,80})'
+    r'|(?P<caps>[^a-z\n]{6,59})$'
+    r'|(?P<titled>[A-Z][a-z]+(?:[^\S\n]+[A-Z][a-z]+){0,5}):[^\S\n]*$'
+    r')',
+    re.MULTILINE
+)
+_SECTION_SKIP_WORDS = ('TABLE OF CONTENTS', 'PAGE', 'CHAPTER', 'APPENDIX', 'BIBLIOGRAPHY', 'REFERENCES')
+
+# Capitalized phrases starting with one of these aren't topics
+_TOPIC_SKIP_WORDS = frozenset({'The', 'This', 'That', 'There', 'These', 'Those', 'Chapter', 'Section', 'Page'})
+# Common words that disqualify a key term wherever they appear in it
+_TERM_SKIP_WORDS = frozenset({'The', 'This', 'That', 'There', 'These', 'Those', 'When', 'Where',
+                              'What', 'Which', 'Who', 'Why', 'How', 'Chapter', 'Section', 'Page'})
+
 
 class PDFSection:
     """Represents a section of content from a PDF."""
@@ -23,33 +53,105 @@ class PDFSection:
         }
 
 
-def analyze_pdf_structure(file_path: str) -> Dict:
+def iter_page_texts(reader: PdfReader) -> Iterator[str]:
+    """Yield the extracted text of each page in order."""
+    for page in reader.pages:
+        yield page.extract_text() or ""
+
+
+# Page text extraction is CPU-bound pure Python, so large PDFs are split across processes
+PARALLEL_EXTRACT_MIN_PAGES = 20
+EXTRACT_CHUNK_PAGES = 16
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", min(4, os.cpu_count() or 1)))
+
+# One pool per web worker process, started on the first large PDF
+_extract_pools: Dict[int, ProcessPoolExecutor] = {}
+_extract_pool_lock = threading.Lock()
+
+
+def _get_extract_pool() -> ProcessPoolExecutor:
+    pid = os.getpid()
+    pool = _extract_pools.get(pid)
+    if pool is None:
+        with _extract_pool_lock:
+            pool = _extract_pools.get(pid)
+            if pool is None:
+                # spawn, not fork - the web workers run gevent, whose hub a forked child must not inherit
+                pool = _extract_pools[pid] = ProcessPoolExecutor(
+                    max_workers=PDF_EXTRACT_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+    return pool
+
+
+@lru_cache(maxsize=1)
+def _open_pool_reader(file_path: str, mtime_ns: int, size: int) -> PdfReader:
+    """Parse a PDF once per pool process for all of its page ranges.
+
+    Keyed on mtime and size as well as the path: an upload filename can be
+    reused after the original is deleted.
+    """
+    return PdfReader(file_path)
+
+
+def _extract_page_range(file_path: str, start: int, stop: int) -> List[str]:
+    """Extract the text of pages [start, stop) - runs in a pool process."""
+    stat = os.stat(file_path)
+    pages = _open_pool_reader(file_path, stat.st_mtime_ns, stat.st_size).pages
+    return [pages[i].extract_text() or "" for i in range(start, stop)]
+
+
+def extract_page_texts(file_path: str, reader: Optional[PdfReader] = None) -> List[str]:
+    """
+    Extract the text of every page in order. PDFs with at least
+    PARALLEL_EXTRACT_MIN_PAGES pages are extracted in parallel page ranges;
+    smaller ones (or any pool failure) use the serial path.
+    """
+    reader = reader or PdfReader(file_path)
+    total_pages = len(reader.pages)
+    if total_pages < PARALLEL_EXTRACT_MIN_PAGES or PDF_EXTRACT_WORKERS < 2:
+        return list(iter_page_texts(reader))
+    
+    try:
+        pool = _get_extract_pool()
+        futures = [
+            pool.submit(_extract_page_range, file_path, start, min(start + EXTRACT_CHUNK_PAGES, total_pages))
+            for start in range(0, total_pages, EXTRACT_CHUNK_PAGES)
+        ]
+        return [text for future in futures for text in future.result()]
+    except Exception as e:
+        print(f"Parallel PDF extraction failed, extracting serially: {e}")
+        # A broken pool stays broken - start a fresh one next time
+        broken = _extract_pools.pop(os.getpid(), None)
+        if broken is not None:
+            broken.shutdown(wait=False)
+        return list(iter_page_texts(reader))
+
+
+def analyze_pdf_structure(file_path: str, reader: Optional[PdfReader] = None, page_texts: Optional[List[str]] = None) -> Dict:
     """
     Analyze PDF and extract structured content:
     - Page-by-page breakdown
     - Sections/chapters with page ranges
     - Topics and key concepts per section
+    
+    Pass an already opened reader and/or its extracted page texts to avoid
+    parsing the file a second time.
     """
     try:
-        reader = PdfReader(file_path)
-        total_pages = len(reader.pages)
+        if page_texts is None:
+            page_texts = extract_page_texts(file_path, reader)
+        total_pages = len(page_texts)
         
-        # Extract text page by page
-        pages_content = []
-        for page_num, page in enumerate(reader.pages, start=1):
-            text = page.extract_text() or ""
-            pages_content.append({
-                "page": page_num,
-                "text": text,
-                "wordCount": len(text.split())
-            })
-        
-        # Extract sections from the PDF
-        sections = extract_sections(pages_content)
+        # Extract sections from the PDF, streaming the pages through once
+        pages_summary = []
+        sections = extract_sections(_iter_pages(page_texts, pages_summary))
         
         # If no sections found, create page-based chunks
         if not sections:
-            sections = create_page_based_chunks(pages_content)
+            sections = create_page_based_chunks(
+                [{"page": page_num, "text": text} for page_num, text in enumerate(page_texts, start=1)]
+            )
         
         # Extract topics from each section
         for section in sections:
@@ -58,9 +160,9 @@ def analyze_pdf_structure(file_path: str) -> Dict:
         
         return {
             "totalPages": total_pages,
-            "totalWords": sum(p["wordCount"] for p in pages_content),
+            "totalWords": sum(p["wordCount"] for p in pages_summary),
             "sections": sections,
-            "pagesContent": [{"page": p["page"], "wordCount": p["wordCount"]} for p in pages_content]
+            "pagesContent": pages_summary
         }
     except Exception as e:
         print(f"Error analyzing PDF: {e}")
@@ -72,49 +174,61 @@ def analyze_pdf_structure(file_path: str) -> Dict:
         }
 
 
-def extract_sections(pages_content: List[Dict]) -> List[Dict]:
+def _iter_pages(page_texts: Iterable[str], pages_summary: List[Dict]) -> Iterator[Dict]:
+    """
+    Yield {"page", "text", "wordCount"} for each page, recording the page
+    number and word count (but not the text) in pages_summary as it goes.
+    """
+    for page_num, text in enumerate(page_texts, start=1):
+        word_count = len(text.split())
+        pages_summary.append({"page": page_num, "wordCount": word_count})
+        yield {"page": page_num, "text": text, "wordCount": word_count}
+
+
+def extract_sections(pages_content: Iterable[Dict]) -> List[Dict]:
     """
     Extract sections/chapters from PDF pages.
     Looks for:
     - Numbered chapters/sections (1. Title, Chapter 2, etc.)
     - Headers (all caps, bold-like patterns)
     - Page breaks that indicate new sections
+    
+    pages_content is iterated once, so it can be a generator.
     """
     sections = []
     current_section = None
-    current_content = []
+    current_content = []  # references to the page texts; joined once when the section closes
     current_pages = []
     
     for page_data in pages_content:
         page_num = page_data["page"]
         text = page_data["text"]
-        lines = text.split('\n')
+        lines = text.split('\n', 10)  # only the first 10 lines are inspected
         
         # Look for section headers in first few lines of page
         header = None
-        for i, line in enumerate(lines[:10]):  # Check first 10 lines
-            line_clean = line.strip()
-            if not line_clean:
-                continue
-            
-            # Pattern 1: Numbered sections "1. Title", "Chapter 2: Title"
-            numbered_match = re.match(r'^\s*(?:Chapter|CHAPTER|Section|SECTION|Part|PART)?\s*(\d+)[\.:]\s+([A-Z][^\n]{5,80})', line_clean, re.IGNORECASE)
-            if numbered_match:
-                header = numbered_match.group(2).strip()
+        # Check first 10 lines. A line starting with a lowercase letter can only be a
+        # header if it is "chapter/section/part N...", so other prose lines skip the regex
+        first_lines = "\n".join(
+            line for line in (raw.strip() for raw in lines[:10])
+            if line and (not "a" <= line[0] <= "z" or line[0] in "csp")
+        )
+        pos = 0
+        while header is None:
+            match = _SECTION_HEADER_RE.search(first_lines, pos)
+            if not match:
                 break
+            pos = match.end()
             
-            # Pattern 2: All caps headers (likely section titles)
-            if line_clean.isupper() and len(line_clean) > 5 and len(line_clean) < 60:
-                # Check if it's not a common non-section word
-                skip_words = ['TABLE OF CONTENTS', 'PAGE', 'CHAPTER', 'APPENDIX', 'BIBLIOGRAPHY', 'REFERENCES']
-                if not any(skip in line_clean for skip in skip_words):
+            if match.group("numbered"):
+                header = match.group("numbered").strip()
+            elif match.group("caps"):
+                # All caps headers (likely section titles), unless a common non-section word
+                line_clean = match.group("caps")
+                if line_clean.isupper() and not any(skip in line_clean for skip in _SECTION_SKIP_WORDS):
                     header = line_clean.title()
-                    break
-            
-            # Pattern 3: Title case headers ending with colon
-            if re.match(r'^[A-Z][a-z]+(?:\s+[A-Z][a-z]+){0,5}:\s*$', line_clean):
-                header = line_clean.rstrip(':').strip()
-                break
+            else:
+                header = match.group("titled").strip()
         
         # If we found a header, save previous section and start new one
         if header and current_section:
@@ -122,7 +236,7 @@ def extract_sections(pages_content: List[Dict]) -> List[Dict]:
                 "title": current_section,
                 "startPage": current_pages[0] if current_pages else page_num,
                 "endPage": current_pages[-1] if current_pages else page_num,
-                "pageNumbers": current_pages.copy(),
+                "pageNumbers": current_pages,
                 "content": "\n".join(current_content)
             })
             current_section = header
@@ -136,16 +250,16 @@ def extract_sections(pages_content: List[Dict]) -> List[Dict]:
         else:
             # Continue current section
             current_content.append(text)
-            if page_num not in current_pages:
-                current_pages.append(page_num)
+            # Pages are visited in ascending order, so page_num is never already present
+            current_pages.append(page_num)
     
     # Add final section
     if current_section:
         sections.append({
             "title": current_section,
             "startPage": current_pages[0] if current_pages else 1,
-            "endPage": current_pages[-1] if current_pages else pages_content[-1]["page"],
-            "pageNumbers": current_pages.copy(),
+            "endPage": current_pages[-1] if current_pages else page_num,
+            "pageNumbers": current_pages,
             "content": "\n".join(current_content)
         })
     
@@ -159,17 +273,22 @@ def create_page_based_chunks(pages_content: List[Dict], chunk_size: int = 5) ->
     chunks = []
     for i in range(0, len(pages_content), chunk_size):
         chunk_pages = pages_content[i:i+chunk_size]
-        page_nums = [p["page"] for p in chunk_pages]
-        content = "\n".join(p["text"] for p in chunk_pages)
+        page_nums = []
+        texts = []
+        for p in chunk_pages:
+            page_nums.append(p["page"])
+            texts.append(p["text"])
+        content = "\n".join(texts)
+        # pages_content is in page order, so the ends of the slice are the range
+        start_page, end_page = page_nums[0], page_nums[-1]
         
         # Try to extract a title from first page
-        first_page_text = chunk_pages[0]["text"]
-        title = extract_title_from_page(first_page_text) or f"Pages {min(page_nums)}-{max(page_nums)}"
+        title = extract_title_from_page(texts[0]) or f"Pages {start_page}-{end_page}"
         
         chunks.append({
             "title": title,
-            "startPage": min(page_nums),
-            "endPage": max(page_nums),
+            "startPage": start_page,
+            "endPage": end_page,
             "pageNumbers": page_nums,
             "content": content
         })
@@ -179,7 +298,7 @@ def create_page_based_chunks(pages_content: List[Dict], chunk_size: int = 5) ->
 
 def extract_title_from_page(text: str) -> str:
     """Extract a potential title from the first few lines of a page."""
-    lines = text.split('\n')[:5]
+    lines = text.split('\n', 5)[:5]
     for line in lines:
         line_clean = line.strip()
         if len(line_clean) > 10 and len(line_clean) < 80:
@@ -191,30 +310,20 @@ def extract_title_from_page(text: str) -> str:
 
 def extract_topics_from_text(text: str, max_topics: int = 10) -> List[str]:
     """Extract topics/concepts from text."""
-    topics = []
-    
+    # Matches are pulled lazily, so scanning stops as soon as max_topics
+    # unique topics are found
     # Pattern 1: Numbered items like "1. Topic", "2. Concept"
-    numbered = re.findall(r'^\s*\d+[\.\)]\s+([A-Z][^\n]{5,60})', text, re.MULTILINE)
-    topics.extend(numbered[:max_topics])
+    numbered = islice((m.group(1) for m in _NUMBERED_TOPIC_RE.finditer(text)), max_topics)
     
     # Pattern 2: Bold-like patterns (if text formatting is preserved)
     # Pattern 3: Capitalized phrases that appear important
-    capitalized = re.findall(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,3})\b', text)
+    capitalized = (m.group(1) for m in _CAPITALIZED_PHRASE_RE.finditer(text))
     # Filter out common words
-    skip_words = ['The', 'This', 'That', 'There', 'These', 'Those', 'Chapter', 'Section', 'Page']
-    capitalized = [c for c in capitalized if c.split()[0] not in skip_words]
-    topics.extend(capitalized[:max_topics])
+    capitalized = islice((c for c in capitalized if c.split(None, 1)[0] not in _TOPIC_SKIP_WORDS), max_topics)
     
     # Remove duplicates
-    seen = set()
-    unique_topics = []
-    for topic in topics:
-        topic_lower = topic.lower()
-        if topic_lower not in seen and len(topic) > 5:
-            seen.add(topic_lower)
-            unique_topics.append(topic)
-    
-    return unique_topics[:max_topics]
+    topics = chain(numbered, capitalized)
+    return _unique_ignoring_case((topic for topic in topics if len(topic) > 5), max_topics)
 
 
 def extract_key_terms_from_text(text: str, max_terms: int = 15) -> List[str]:
@@ -223,23 +332,26 @@ def extract_key_terms_from_text(text: str, max_terms: int = 15) -> List[str]:
     # Pattern: "Term" or Term (possibly italicized or capitalized)
     
     # Find capitalized terms (technical terms often start with capitals)
-    terms = re.findall(r'\b([A-Z][A-Za-z]{3,20}(?:\s+[A-Z][A-Za-z]{2,15}){0,2})\b', text)
+    terms = (m.group(1) for m in _KEY_TERM_RE.finditer(text))
     
     # Filter common words
-    common_words = {'The', 'This', 'That', 'There', 'These', 'Those', 'When', 'Where', 
-                   'What', 'Which', 'Who', 'Why', 'How', 'Chapter', 'Section', 'Page'}
-    terms = [t for t in terms if not any(cw in t.split() for cw in common_words)]
+    terms = (t for t in terms if _TERM_SKIP_WORDS.isdisjoint(t.split()))
     
     # Remove duplicates
-    seen = set()
-    unique_terms = []
-    for term in terms:
-        term_lower = term.lower()
-        if term_lower not in seen:
-            seen.add(term_lower)
-            unique_terms.append(term)
-    
-    return unique_terms[:max_terms]
+    return _unique_ignoring_case(terms, max_terms)
+
+
+def _unique_ignoring_case(items: Iterator[str], limit: int) -> List[str]:
+    """
+    First occurrence of each item, compared case-insensitively, in order.
+    Stops consuming items once limit unique ones are found.
+    """
+    unique = {}
+    for item in items:
+        if len(unique) >= limit:
+            break
+        unique.setdefault(item.lower(), item)
+    return list(unique.values())
 
 
 def split_content_for_study(sections: List[Dict], num_sessions: int) -> List[Dict]:
@@ -253,20 +365,20 @@ def split_content_for_study(sections: List[Dict], num_sessions: int) -> List[Dic
     if not sections:
         return []
     
-    # Calculate total content size
-    total_size = sum(len(s.get("content", "").split()) for s in sections)
+    # Calculate total content size - per-section word counts are reused in the loop below
+    word_counts = [len(s.get("content", "").split()) for s in sections]
+    total_size = sum(word_counts)
     target_size_per_session = total_size / num_sessions if num_sessions > 0 else total_size
     
     study_chunks = []
     current_chunk = {
         "sections": [],
-        "pages": [],
+        "pages": set(),  # sorted into a list once the chunk is finalized
         "totalWords": 0,
         "title": ""
     }
     
-    for section in sections:
-        section_size = len(section.get("content", "").split())
+    for section, section_size in zip(sections, word_counts):
         
         # If adding this section would exceed target, finalize current chunk
         if (current_chunk["totalWords"] + section_size > target_size_per_session * 1.5 and 
@@ -277,19 +389,19 @@ def split_content_for_study(sections: List[Dict], num_sessions: int) -> List[Dic
             else:
                 current_chunk["title"] = f"{current_chunk['sections'][0].get('title', 'Content')} & More"
             
+            current_chunk["pages"] = sorted(current_chunk["pages"])
             study_chunks.append(current_chunk)
             current_chunk = {
                 "sections": [],
-                "pages": [],
+                "pages": set(),
                 "totalWords": 0,
                 "title": ""
             }
         
         # Add section to current chunk
         current_chunk["sections"].append(section)
-        current_chunk["pages"].extend(section.get("pageNumbers", []))
+        current_chunk["pages"].update(section.get("pageNumbers", []))
         current_chunk["totalWords"] += section_size
-        current_chunk["pages"] = sorted(set(current_chunk["pages"]))
     
     # Add final chunk
     if current_chunk["sections"]:
@@ -297,6 +409,7 @@ def split_content_for_study(sections: List[Dict], num_sessions: int) -> List[Dic
             current_chunk["title"] = current_chunk["sections"][0].get("title", "Study Content")
         else:
             current_chunk["title"] = f"{current_chunk['sections'][0].get('title', 'Content')} & More"
+        current_chunk["pages"] = sorted(current_chunk["pages"])
         study_chunks.append(current_chunk)
     
     return study_chunks
@@ -1,7 +1,6 @@
 from datetime import date, timedelta
-from typing import List, Dict, Optional
-import json
-from models import Material, StudyTask
+from typing import List, Dict, Optional, Tuple
+from models import Material, StudyTask, TTLCache
 from services.topic_extractor import extract_topics_from_material, extract_key_terms
 from services.pdf_analyzer import split_content_for_study
 
@@ -28,87 +27,35 @@ def generate_study_tasks_for_course(course: Dict) -> List[Dict]:
         total_days = 1
 
     # Extract topics and structured content from materials
-    all_topics = []
-    key_terms = []
-    all_sections = []
-    material_content_chunks = []
-    
     course_id = course["id"]
-    materials = Material.find_by_course(course_id)
-    
-    for material in materials:
-        topics = extract_topics_from_material(material)
-        all_topics.extend(topics)
-        terms = extract_key_terms(material)
-        key_terms.extend(terms)
-        
-        # Extract structured content from PDF
-        if material.get("metadata_json"):
-            try:
-                pdf_structure = json.loads(material["metadata_json"])
-                sections = pdf_structure.get("sections", [])
-                if sections:
-                    all_sections.extend(sections)
-                    # Store material reference with sections
-                    for section in sections:
-                        section["materialId"] = material["id"]
-                        section["materialTitle"] = material["title"]
-            except Exception as e:
-                print(f"Error parsing PDF structure for material {material.get('id')}: {e}")
-
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_topics = []
-    for topic in all_topics:
-        topic_lower = topic.lower()
-        if topic_lower not in seen:
-            seen.add(topic_lower)
-            unique_topics.append(topic)
+    unique_topics, key_terms, all_sections = _load_course_content(course_id)
 
     # Split content into study chunks if we have structured sections
     content_chunks = None
     if all_sections:
         # Determine number of study sessions first
-        if total_days <= 7:
-            num_sessions = min(3, total_days)
-        elif total_days <= 30:
-            num_sessions = min(8, total_days // 3)
-        elif total_days <= 60:
-            num_sessions = min(12, total_days // 5)
-        else:
-            num_sessions = min(16, total_days // 7)
-        if num_sessions <= 0:
-            num_sessions = 1
-        
-        content_chunks = split_content_for_study(all_sections, num_sessions)
+        content_chunks = split_content_for_study(all_sections, _session_count(total_days))
 
     # Determine number of study sessions based on timeline
-    if content_chunks:
-        num_sessions = len(content_chunks)
-    elif total_days <= 7:
-        num_sessions = min(3, total_days)
-    elif total_days <= 30:
-        num_sessions = min(8, total_days // 3)
-    elif total_days <= 60:
-        num_sessions = min(12, total_days // 5)
-    else:
-        num_sessions = min(16, total_days // 7)
-
-    if num_sessions <= 0:
-        num_sessions = 1
+    num_sessions = len(content_chunks) if content_chunks else _session_count(total_days)
 
     tasks: List[StudyTask] = []
     
     # Calculate session dates with spaced repetition (more frequent near exam)
     session_dates = _calculate_session_dates(start, end, num_sessions, exam_date)
     
+    total_sessions = len(session_dates)
+    chunks_len = len(content_chunks) if content_chunks else 0
+    # Sessions on or after this date fall within a week of the exam
+    exam_window_start = exam_date - timedelta(days=7) if exam_date else None
+
     # Generate tasks with meaningful content and specific material references
     for i, session_date in enumerate(session_dates):
-        progress = (i + 1) / len(session_dates)
-        is_near_exam = exam_date and (exam_date - session_date).days <= 7
+        progress = (i + 1) / total_sessions
+        is_near_exam = exam_window_start is not None and session_date >= exam_window_start
         
         # Get content chunk for this session if available
-        content_chunk = content_chunks[i] if content_chunks and i < len(content_chunks) else None
+        content_chunk = content_chunks[i] if i < chunks_len else None
         
         # Determine session type and content
         if i == 0:
@@ -117,7 +64,7 @@ def generate_study_tasks_for_course(course: Dict) -> List[Dict]:
             description = _generate_intro_description(course, unique_topics, content_chunk)
         elif is_near_exam and progress > 0.7:
             # Exam prep sessions
-            title, description = _generate_exam_prep_session(unique_topics, key_terms, i, len(session_dates), content_chunk)
+            title, description = _generate_exam_prep_session(unique_topics, key_terms, i, total_sessions, content_chunk)
         elif content_chunk:
             # Content-based session with specific pages/sections
             title = content_chunk.get("title", f"Study Session {i + 1}")
@@ -135,7 +82,7 @@ def generate_study_tasks_for_course(course: Dict) -> List[Dict]:
 
         task = {
             "course_id": course_id,
-            "date": session_date.isoformat(),
+            "date": session_date,
             "title": title,
             "description": description,
             "completed": False,
@@ -145,47 +92,113 @@ def generate_study_tasks_for_course(course: Dict) -> List[Dict]:
     return tasks
 
 
-def _calculate_session_dates(start: date, end: date, num_sessions: int, exam_date: date = None) -> List[date]:
+def _session_count(total_days: int) -> int:
+    """Number of study sessions to schedule for a term of total_days."""
+    if total_days <= 7:
+        num_sessions = min(3, total_days)
+    elif total_days <= 30:
+        num_sessions = min(8, total_days // 3)
+    elif total_days <= 60:
+        num_sessions = min(12, total_days // 5)
+    else:
+        num_sessions = min(16, total_days // 7)
+    return max(1, num_sessions)
+
+
+# Topics, key terms and sections per course, keyed by (course_id, material ids).
+# Materials are never edited in place, so a changed id list is the only way the
+# content changes and the key can't go stale
+_course_content_cache = TTLCache(maxsize=64, ttl=600)
+
+
+def _load_course_content(course_id: str) -> Tuple[List[str], List[str], List[Dict]]:
+    """
+    Extract topics, key terms and PDF sections from a course's materials.
+    Repeat plan generations for unchanged materials reuse the cached result
+    instead of refetching and re-parsing every material.
+    """
+    cache_key = (course_id, Material.ids_by_course(course_id))
+    cached = _course_content_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # Topics are deduplicated case-insensitively as they arrive, keeping the first spelling
+    topics_by_key = {}
+    key_terms = []
+    all_sections = []
+    
+    for material in Material.iter_by_course(course_id):
+        for topic in extract_topics_from_material(material):
+            topics_by_key.setdefault(topic.lower(), topic)
+        terms = extract_key_terms(material)
+        key_terms.extend(terms)
+        
+        # Extract structured content from PDF
+        if material.get("sections") or material.get("metadata_json"):
+            try:
+                sections = Material.sections_of(material)
+                if sections:
+                    all_sections.extend(sections)
+                    # Store material reference with sections
+                    for section in sections:
+                        section["materialId"] = material["id"]
+                        section["materialTitle"] = material["title"]
+            except Exception as e:
+                print(f"Error parsing PDF structure for material {material.get('id')}: {e}")
+
+    content = (list(topics_by_key.values()), key_terms, all_sections)
+    _course_content_cache.set(cache_key, content)
+    return content
+
+
+def _calculate_session_dates(start: date, end: date, num_sessions: int, exam_date: date = None, fill_gaps: bool = True) -> List[date]:
     """
     Calculate session dates using spaced repetition:
     - More frequent sessions as exam approaches
     - Avoid weekends for early sessions (optional, can be removed)
+    
+    Shared by the rule-based and AI planners. With fill_gaps, missing sessions
+    are added at the midpoints of wide gaps.
     """
     total_days = (end - start).days + 1
     if total_days <= 1:
         return [start]
 
-    dates = []
+    # Sessions are worked out as integer day offsets from start, and only
+    # turned into dates once at the end
+    offsets = set()
     
     if exam_date and num_sessions > 4:
         # Two-phase approach: regular spacing early, intensive near exam
+        exam_offset = (exam_date - start).days
         exam_prep_days = min(14, (end - exam_date).days) if exam_date else 0
         early_sessions = max(1, num_sessions // 2)
         prep_sessions = num_sessions - early_sessions
         
         # Early sessions: evenly spaced
-        early_start = start
-        early_end = max(start, exam_date - timedelta(days=exam_prep_days + 1))
-        early_days = (early_end - early_start).days + 1
+        early_end = max(0, exam_offset - exam_prep_days - 1)
+        early_days = early_end + 1
+        last_early = None
         if early_days > 0:
             early_step = max(1, early_days // max(1, early_sessions))
             for i in range(early_sessions):
                 day_offset = i * early_step
-                session_date = early_start + timedelta(days=day_offset)
-                if session_date <= early_end:
-                    dates.append(session_date)
+                if day_offset <= early_end:
+                    offsets.add(day_offset)
+                    last_early = day_offset
         
         # Exam prep sessions: more frequent
-        prep_start = max(dates[-1] + timedelta(days=3), exam_date - timedelta(days=exam_prep_days)) if dates else exam_date - timedelta(days=exam_prep_days)
-        prep_end = exam_date - timedelta(days=1)  # Don't schedule on exam day
-        prep_days = (prep_end - prep_start).days + 1
+        prep_start = exam_offset - exam_prep_days
+        if last_early is not None:
+            prep_start = max(last_early + 3, prep_start)
+        prep_end = exam_offset - 1  # Don't schedule on exam day
+        prep_days = prep_end - prep_start + 1
         if prep_days > 0:
             prep_step = max(1, prep_days // max(1, prep_sessions))
             for i in range(prep_sessions):
-                day_offset = i * prep_step
-                session_date = prep_start + timedelta(days=day_offset)
-                if session_date < exam_date and session_date not in dates:
-                    dates.append(session_date)
+                day_offset = prep_start + i * prep_step
+                if day_offset < exam_offset:
+                    offsets.add(day_offset)
     else:
         # Simple spacing: exponential curve (more frequent near end)
         for i in range(num_sessions):
@@ -193,28 +206,26 @@ def _calculate_session_dates(start: date, end: date, num_sessions: int, exam_dat
             progress = (i + 1) / num_sessions
             # Early sessions spaced more, later sessions closer together
             day_position = int(total_days * (progress ** 1.5))
-            session_date = start + timedelta(days=min(day_position, total_days - 1))
-            if session_date not in dates:
-                dates.append(session_date)
+            offsets.add(min(day_position, total_days - 1))
 
     # Sort and ensure no duplicates
-    dates = sorted(set(dates))
+    ordered = sorted(offsets)
     
     # If we have too few dates, fill gaps
-    if len(dates) < num_sessions:
-        extra_needed = num_sessions - len(dates)
-        # Add evenly spaced dates in gaps
-        for i in range(1, len(dates)):
-            if extra_needed <= 0:
-                break
-            gap = (dates[i] - dates[i-1]).days
-            if gap > 2:
-                mid_date = dates[i-1] + timedelta(days=gap // 2)
-                dates.append(mid_date)
+    if fill_gaps and len(ordered) < num_sessions:
+        extra_needed = num_sessions - len(ordered)
+        # Add evenly spaced dates in gaps. Each midpoint lands strictly inside
+        # its gap, so merging in place keeps the offsets sorted and unique
+        filled = ordered[:1]
+        for i in range(1, len(ordered)):
+            gap = ordered[i] - ordered[i-1]
+            if extra_needed > 0 and gap > 2:
+                filled.append(ordered[i-1] + gap // 2)
                 extra_needed -= 1
-        dates = sorted(set(dates))
+            filled.append(ordered[i])
+        ordered = filled
 
-    return dates[:num_sessions]
+    return [start + timedelta(days=offset) for offset in ordered[:num_sessions]]
 
 
 def _generate_intro_description(course: Dict, topics: List[str], content_chunk: Optional[Dict] = None) -> str:
@@ -1,5 +1,36 @@
+import hashlib
 import re
-from typing import List, Dict
+from typing import Callable, List, Dict, Iterator
+from models import TTLCache
+
+# Patterns are compiled once at import rather than looked up per call
+_NUMBERED_RE = re.compile(r'^\s*(?:Chapter\s+)?\d+[\.:]\s+([A-Z][^\n]{10,80})', re.MULTILINE | re.IGNORECASE)
+_HEADER_RE = re.compile(r'^([A-Z][A-Za-z\s]{5,60}):\s*$', re.MULTILINE)
+# The syllabus patterns are unanchored and can match inside a numbered line
+# ("1. Week 1: ..."), so they keep their own scans. Each is paired with the
+# keywords it needs, so a scan is skipped when none of them occurs in the text
+_SYLLABUS_RES = [
+    (keywords, re.compile(pattern, re.MULTILINE | re.IGNORECASE))
+    for keywords, pattern in (
+        (("week", "unit", "module"), r'(?:Week|Unit|Module)\s+\d+[:\-]\s*([A-Z][^\n]{10,60})'),
+        (("topic",), r'Topic\s+\d+[:\-]\s*([A-Z][^\n]{10,60})'),
+    )
+]
+# Skip words match anywhere in a candidate (so "COURSE" also drops "COURSES"),
+# checked with one alternation search instead of a Python-level any() loop
+_HEADER_SKIP_RE = re.compile(
+    'SYLLABUS|OBJECTIVES|REQUIREMENTS|GRADING|SCHEDULE|ASSIGNMENTS|TEXTBOOK|REFERENCES|COURSE',
+    re.IGNORECASE
+)
+_TERM_SKIP_RE = re.compile('Course|Students|Instructor|Required|Optional|Assignment|Project|Exam|Final|Midterm')
+_TERM_RE = re.compile(r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,3})\b')
+KEY_TERM_SCAN_CHARS = 5000
+# Every term starts with an ASCII capital; a charset-only search finds one (or
+# rules the text out) far faster than trying the term pattern at each position
+_ASCII_UPPER_RE = re.compile('[A-Z]')
+
+# Topics by a digest of the material text - keyed on content, so entries never go stale
+_topics_cache = TTLCache(maxsize=512, ttl=86400)
 
 
 def extract_topics_from_material(material: Dict) -> List[str]:
@@ -11,66 +42,108 @@ def extract_topics_from_material(material: Dict) -> List[str]:
     - Headers (all caps lines, lines ending with colon)
     - Common syllabus patterns
     """
-    if not material.raw_text:
+    if not material.get("raw_text"):
         return []
     
-    text = material.raw_text
-    
+    text = material["raw_text"]
+    # Extraction is deterministic in the text, and hashing it is far cheaper
+    # than the regex scans, so repeat plans over the same material reuse the result
+    key = hashlib.blake2b(text.encode("utf-8", "surrogatepass"), digest_size=16).digest()
+    topics = _topics_cache.get(key)
+    if topics is None:
+        topics = _extract_topics(text)
+        _topics_cache.set(key, topics)
+    return list(topics)
+
+
+def _extract_topics(text: str) -> List[str]:
+    """Run the topic heuristics of extract_topics_from_material over text."""
     topics = []
     
     # Pattern 1: Numbered sections like "1. Topic", "2. Topic", etc.
-    numbered_pattern = r'^\s*(?:Chapter\s+)?(\d+)[\.:]\s+([A-Z][^\n]{10,80})'
-    matches = re.finditer(numbered_pattern, text, re.MULTILINE | re.IGNORECASE)
-    for match in matches:
-        topic = match.group(2).strip()
-        # Clean up topic name
-        topic = re.sub(r'\s+', ' ', topic)
-        topic = topic.split('\n')[0]  # Take first line only
+    # A numbered line can only start with whitespace (a blank line before it),
+    # a digit or "Chapter"
+    for match in _iter_line_matches(_NUMBERED_RE, text, _could_start_numbered):
+        # Clean up topic name (trim and collapse whitespace) - the match
+        # already stops at the end of its line
+        topic = ' '.join(match.group(1).split())
         if len(topic) > 10 and len(topic) < 100:
             topics.append(topic)
     
     # Pattern 2: Lines that look like headers (all caps or title case, end with colon)
-    header_pattern = r'^([A-Z][A-Za-z\s]{5,60}):\s*$'
-    matches = re.finditer(header_pattern, text, re.MULTILINE)
-    for match in matches:
+    # Scanned separately: a numbered match can run across lines and swallow
+    # a header the header scan would match on its own
+    for match in _iter_line_matches(_HEADER_RE, text, _could_start_header):
         topic = match.group(1).strip()
         # Skip common non-topic headers
-        skip_words = ['SYLLABUS', 'OBJECTIVES', 'REQUIREMENTS', 'GRADING', 'SCHEDULE', 
-                     'ASSIGNMENTS', 'TEXTBOOK', 'REFERENCES', 'COURSE']
-        if not any(skip in topic.upper() for skip in skip_words):
+        if _HEADER_SKIP_RE.search(topic) is None:
             if len(topic) > 5 and len(topic) < 80:
                 topics.append(topic)
     
     # Pattern 3: Common syllabus topic patterns
-    syllabus_patterns = [
-        r'(?:Week|Unit|Module)\s+\d+[:\-]\s*([A-Z][^\n]{10,60})',
-        r'Topic\s+\d+[:\-]\s*([A-Z][^\n]{10,60})',
-    ]
-    for pattern in syllabus_patterns:
-        matches = re.finditer(pattern, text, re.MULTILINE | re.IGNORECASE)
+    # The keyword check is only exact for ASCII text: IGNORECASE also matches
+    # letters like "ı" that lower() doesn't map onto the keywords
+    lowered = text.lower() if text.isascii() else None
+    for keywords, pattern in _SYLLABUS_RES:
+        if lowered is not None and not any(keyword in lowered for keyword in keywords):
+            continue
+        matches = pattern.finditer(text)
         for match in matches:
-            topic = match.group(1).strip()
-            topic = re.sub(r'\s+', ' ', topic)
+            topic = ' '.join(match.group(1).split())
             if len(topic) > 10 and len(topic) < 100:
                 topics.append(topic)
     
-    # Remove duplicates while preserving order
-    seen = set()
-    unique_topics = []
+    # Remove duplicates while preserving order, keeping the first spelling
+    topics_by_key = {}
     for topic in topics:
-        topic_lower = topic.lower()
-        if topic_lower not in seen:
-            seen.add(topic_lower)
-            unique_topics.append(topic)
+        topics_by_key.setdefault(topic.lower(), topic)
+    unique_topics = list(topics_by_key.values())
     
     # If we found many topics, take the most distinct ones
     if len(unique_topics) > 15:
-        # Keep first few and sample the rest
-        unique_topics = unique_topics[:5] + unique_topics[5::len(unique_topics)//10][:10]
+        # Keep first few and sample the rest - every step-th topic, at most 10,
+        # bounded in the slice itself so no intermediate stride list is built
+        step = len(unique_topics) // 10
+        unique_topics = unique_topics[:5] + unique_topics[5:5 + 10 * step:step]
     
     return unique_topics
 
 
+def _could_start_numbered(first: str) -> bool:
+    return first.isspace() or first.isdecimal() or first in "cC"
+
+
+def _could_start_header(first: str) -> bool:
+    return "A" <= first <= "Z"
+
+
+def _iter_line_matches(pattern: re.Pattern, text: str,
+                       could_start: Callable[[str], bool]) -> Iterator[re.Match]:
+    """
+    Same matches as pattern.finditer(text) for a pattern anchored with ^,
+    trying it only at line starts whose first character passes could_start.
+    Other positions can't match, so str.find locates the lines and the rest
+    are skipped without running the regex. Matching still runs against the
+    whole text, so matches spanning lines (e.g. "1.\nIntroduction ...") are kept.
+    """
+    match_at = pattern.match
+    pos = 0
+    end = len(text)
+    while pos < end:
+        if could_start(text[pos]):
+            match = match_at(text, pos)
+            if match:
+                yield match
+                pos = match.end()
+                # A match that consumed a newline already ends at a line start
+                if text[pos - 1] == "\n":
+                    continue
+        pos = text.find("\n", pos)
+        if pos < 0:
+            break
+        pos += 1
+
+
 def extract_key_terms(material: Dict) -> List[str]:
     """
     Extract key terms/concepts from material text.
@@ -79,30 +152,28 @@ def extract_key_terms(material: Dict) -> List[str]:
     if not material.get("raw_text"):
         return []
     
-    text = material["raw_text"][:5000]  # Limit to first 5k chars for performance
+    text = material["raw_text"]
+    if _ASCII_UPPER_RE.search(text, 0, KEY_TERM_SCAN_CHARS) is None:
+        return []
     
     # Find capitalized terms that might be concepts
     # Pattern: sequences of capitalized words (2-4 words)
-    term_pattern = r'\b([A-Z][a-z]+(?:\s+[A-Z][a-z]+){1,3})\b'
-    matches = re.finditer(term_pattern, text)
+    # Limit to first 5k chars for performance - endpos scans the raw text as if
+    # it ended there, without copying a slice
+    matches = _TERM_RE.finditer(text, 0, KEY_TERM_SCAN_CHARS)
     
     terms = []
     for match in matches:
         term = match.group(1).strip()
         # Skip if it's a common phrase
-        skip = ['Course', 'Students', 'Instructor', 'Required', 'Optional', 
-                'Assignment', 'Project', 'Exam', 'Final', 'Midterm']
-        if not any(skip_word in term for skip_word in skip):
+        if _TERM_SKIP_RE.search(term) is None:
             if len(term) > 5 and len(term) < 40:
                 terms.append(term)
     
-    # Remove duplicates
-    seen = set()
-    unique_terms = []
+    # Remove duplicates, keeping the first spelling
+    terms_by_key = {}
     for term in terms:
-        term_lower = term.lower()
-        if term_lower not in seen:
-            seen.add(term_lower)
-            unique_terms.append(term)
+        terms_by_key.setdefault(term.lower(), term)
+    unique_terms = list(terms_by_key.values())
     
     return unique_terms[:20]  # Limit to 20 terms
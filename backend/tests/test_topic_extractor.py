@@ -0,0 +1,16 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.topic_extractor import extract_topics_from_material
+
+
+def test_header_overlapping_numbered_match_is_kept():
+    # The numbered match runs across the line break and covers the header
+    # line; the header scan must still find it on its own
+    text = "1.\nIntroduction To Things:\nmore text here"
+    assert extract_topics_from_material({"raw_text": text}) == [
+        "Introduction To Things:",
+        "Introduction To Things",
+    ]
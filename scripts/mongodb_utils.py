@@ -4,8 +4,10 @@ MongoDB Utility Scripts for Learnium
 Use this script to manage your database from the command line.
 """
 
+import atexit
 import os
 import sys
+from datetime import date, datetime, timezone
 from pymongo import MongoClient
 from bson import ObjectId
 from dotenv import load_dotenv
@@ -16,62 +18,112 @@ load_dotenv()
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
 DB_NAME = os.getenv("MONGO_DB_NAME", "study_coach")
 
-client = MongoClient(MONGO_URI)
+# One-shot commands run sequentially, so a single lazily opened connection is
+# enough, and an unreachable server should fail fast instead of after 30s
+client = MongoClient(
+    MONGO_URI,
+    maxPoolSize=1,
+    minPoolSize=0,
+    serverSelectionTimeoutMS=2000,
+    connect=False,
+    appname="study-coach-cli",
+)
+atexit.register(client.close)
 db = client[DB_NAME]
 
 
+def _write_lines(lines):
+    """Write a listing to stdout in one call rather than one print per line."""
+    sys.stdout.write("\n".join(lines) + "\n")
+    sys.stdout.flush()
+
+
 def list_users():
     """List all users in the database."""
-    users = db.users.find()
-    print(f"\n=== Users ({db.users.count_documents({})} total) ===")
+    # Every row is printed anyway, so count the fetched rows instead of a separate count_documents
+    users = list(db.users.find({}, {"email": 1, "name": 1, "created_at": 1}))
+    lines = [f"\n=== Users ({len(users)} total) ==="]
     for user in users:
-        print(f"ID: {user['_id']}")
-        print(f"  Email: {user['email']}")
-        print(f"  Name: {user.get('name', 'N/A')}")
-        print(f"  Created: {user.get('created_at', 'N/A')}")
-        print()
+        lines += [
+            f"ID: {user['_id']}",
+            f"  Email: {user['email']}",
+            f"  Name: {user.get('name', 'N/A')}",
+            f"  Created: {user.get('created_at', 'N/A')}",
+            "",
+        ]
+    _write_lines(lines)
+
+
+def _lookup_one(local_field, from_collection, as_field):
+    """$lookup stage joining the document referenced by local_field into as_field (a 0/1 element list)."""
+    return {"$lookup": {
+        "from": from_collection,
+        "localField": local_field,
+        "foreignField": "_id",
+        "as": as_field,
+    }}
 
 
 def list_courses():
     """List all courses in the database."""
-    courses = db.courses.find()
-    print(f"\n=== Courses ({db.courses.count_documents({})} total) ===")
+    # Join each course's owner server-side instead of one find_one per course
+    courses = list(db.courses.aggregate([
+        {"$project": {"name": 1, "user_id": 1, "term_start": 1, "term_end": 1}},
+        _lookup_one("user_id", "users", "user"),
+        {"$project": {"name": 1, "term_start": 1, "term_end": 1, "user.email": 1}},
+    ]))
+    lines = [f"\n=== Courses ({len(courses)} total) ==="]
     for course in courses:
-        user = db.users.find_one({"_id": course["user_id"]})
-        user_email = user["email"] if user else "Unknown"
-        print(f"ID: {course['_id']}")
-        print(f"  Name: {course['name']}")
-        print(f"  User: {user_email}")
-        print(f"  Term: {course['term_start']} → {course['term_end']}")
-        print()
+        user_email = course["user"][0]["email"] if course["user"] else "Unknown"
+        lines += [
+            f"ID: {course['_id']}",
+            f"  Name: {course['name']}",
+            f"  User: {user_email}",
+            f"  Term: {course['term_start']} → {course['term_end']}",
+            "",
+        ]
+    _write_lines(lines)
 
 
 def list_materials():
     """List all materials in the database."""
-    materials = db.materials.find()
-    print(f"\n=== Materials ({db.materials.count_documents({})} total) ===")
+    # Project first - materials carry raw_text and PDF metadata that the listing never shows
+    materials = list(db.materials.aggregate([
+        {"$project": {"title": 1, "course_id": 1, "file_path": 1}},
+        _lookup_one("course_id", "courses", "course"),
+        {"$project": {"title": 1, "file_path": 1, "course.name": 1}},
+    ]))
+    lines = [f"\n=== Materials ({len(materials)} total) ==="]
     for material in materials:
-        course = db.courses.find_one({"_id": material["course_id"]})
-        course_name = course["name"] if course else "Unknown"
-        print(f"ID: {material['_id']}")
-        print(f"  Title: {material['title']}")
-        print(f"  Course: {course_name}")
-        print(f"  File: {material.get('file_path', 'N/A')}")
-        print()
+        course_name = material["course"][0]["name"] if material["course"] else "Unknown"
+        lines += [
+            f"ID: {material['_id']}",
+            f"  Title: {material['title']}",
+            f"  Course: {course_name}",
+            f"  File: {material.get('file_path', 'N/A')}",
+            "",
+        ]
+    _write_lines(lines)
 
 
 def list_study_tasks():
     """List all study tasks in the database."""
-    tasks = db.study_tasks.find()
-    print(f"\n=== Study Tasks ({db.study_tasks.count_documents({})} total) ===")
+    tasks = list(db.study_tasks.aggregate([
+        {"$project": {"course_id": 1, "date": 1, "title": 1}},
+        _lookup_one("course_id", "courses", "course"),
+        {"$project": {"date": 1, "title": 1, "course.name": 1}},
+    ]))
+    lines = [f"\n=== Study Tasks ({len(tasks)} total) ==="]
     for task in tasks:
-        course = db.courses.find_one({"_id": task["course_id"]})
-        course_name = course["name"] if course else "Unknown"
-        print(f"ID: {task['_id']}")
-        print(f"  Course: {course_name}")
-        print(f"  Date: {task['date']}")
-        print(f"  Title: {task['title']}")
-        print()
+        course_name = task["course"][0]["name"] if task["course"] else "Unknown"
+        lines += [
+            f"ID: {task['_id']}",
+            f"  Course: {course_name}",
+            f"  Date: {task['date']}",
+            f"  Title: {task['title']}",
+            "",
+        ]
+    _write_lines(lines)
 
 
 def stats():
@@ -99,13 +151,12 @@ def delete_user(email):
         print("Cancelled.")
         return
     
-    # Delete user's courses and associated data
-    courses = list(db.courses.find({"user_id": user_id}))
-    for course in courses:
-        # Delete materials
-        db.materials.delete_many({"course_id": course["_id"]})
-        # Delete study tasks
-        db.study_tasks.delete_many({"course_id": course["_id"]})
+    # Delete user's courses and associated data - one delete per collection,
+    # however many courses the user has
+    course_ids = [course["_id"] for course in db.courses.find({"user_id": user_id}, {"_id": 1})]
+    if course_ids:
+        db.materials.delete_many({"course_id": {"$in": course_ids}})
+        db.study_tasks.delete_many({"course_id": {"$in": course_ids}})
     
     # Delete courses
     db.courses.delete_many({"user_id": user_id})
@@ -116,6 +167,48 @@ def delete_user(email):
     print(f"User {email} and all associated data deleted.")
 
 
+def ensure_indexes():
+    """Create the indexes the app and these commands rely on (safe to re-run).
+
+    Uses the backend's index definitions on this script's own connection:
+    its compound course_id/user_id indexes also serve the plain lookups here.
+    Superseded single-field indexes are dropped and listed.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+    from models import create_indexes, drop_legacy_indexes
+    create_indexes(db)
+    dropped = drop_legacy_indexes(db)
+    if dropped:
+        print(f"Dropped superseded indexes: {', '.join(dropped)}")
+    else:
+        print("No superseded indexes to drop.")
+
+
+def _iso_to_bson_date(value):
+    """Convert a legacy "YYYY-MM-DD" string to a midnight UTC datetime."""
+    if isinstance(value, str) and value:
+        d = date.fromisoformat(value)
+        return datetime(d.year, d.month, d.day, tzinfo=timezone.utc)
+    return value
+
+
+def migrate_dates():
+    """Convert ISO date strings on courses and study tasks to native BSON Dates."""
+    fields_by_collection = {
+        "courses": ["term_start", "term_end", "main_exam_date"],
+        "study_tasks": ["date"],
+    }
+    for collection_name, fields in fields_by_collection.items():
+        collection = db[collection_name]
+        query = {"$or": [{field: {"$type": "string"}} for field in fields]}
+        updated = 0
+        for doc in collection.find(query, {field: 1 for field in fields}):
+            changes = {field: _iso_to_bson_date(doc.get(field)) for field in fields if isinstance(doc.get(field), str)}
+            collection.update_one({"_id": doc["_id"]}, {"$set": changes})
+            updated += 1
+        print(f"{collection_name}: converted {updated} documents")
+
+
 def main():
     if len(sys.argv) < 2:
         print("Usage:")
@@ -125,6 +218,8 @@ def main():
         print("  python mongodb_utils.py list-tasks")
         print("  python mongodb_utils.py stats")
         print("  python mongodb_utils.py delete-user <email>")
+        print("  python mongodb_utils.py migrate-dates")
+        print("  python mongodb_utils.py ensure-indexes")
         return
     
     command = sys.argv[1]
@@ -141,6 +236,10 @@ def main():
         stats()
     elif command == "delete-user" and len(sys.argv) > 2:
         delete_user(sys.argv[2])
+    elif command == "migrate-dates":
+        migrate_dates()
+    elif command == "ensure-indexes":
+        ensure_indexes()
     else:
         print(f"Unknown command: {command}")
 